@@ -0,0 +1,115 @@
+import threading
+import time
+from decimal import Decimal, InvalidOperation
+from typing import Dict, List, Tuple
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import Session
+from api.fixed import from_micro, to_micro
+from api.models import AccountValue
+import logging
+
+logger = logging.getLogger('tws-alpha')
+
+Key = Tuple[str, str, str]
+Value = Tuple[int | None, str | None]
+
+INT64 = (-2**63, 2**63 - 1)
+
+def _parse(val: str) -> Value:
+    """(micro-units, None) for numbers that fit an SQLite INTEGER, (None, val) for everything else."""
+    try:
+        units = to_micro(Decimal(val))
+    except (InvalidOperation, ValueError, OverflowError):
+        return None, val
+    if not INT64[0] <= units <= INT64[1]:
+        return None, val
+    return units, None
+
+def _unpack(value: int | None, text: str | None) -> Decimal | str:
+    return text if value is None else from_micro(value)
+
+
+class AccountValues:
+    """
+    Latest updateAccountValue per (account, key, currency), in memory.
+
+    update() compares against the latest value and stages a history row only
+    when it differs; flush() writes everything staged in one transaction and
+    is called on accountDownloadEnd / updateAccountTime, which close each burst
+    TWS sends. Numeric values come back as Decimal, the rest as str.
+    """
+    def __init__(self, engine):
+        self.engine = engine
+        self._latest: Dict[Key, Value] = {}
+        self._pending: List[dict] = []
+        self._lock = threading.Lock()
+        self._load_latest()
+
+    def _load_latest(self):
+        with Session(self.engine) as session:
+            newest = (select(AccountValue.account_id, AccountValue.key, AccountValue.currency, func.max(AccountValue.ts).label("ts"))
+                .group_by(AccountValue.account_id, AccountValue.key, AccountValue.currency).subquery())
+            rows = session.execute(select(AccountValue)
+                .join(newest, (AccountValue.account_id == newest.c.account_id) & (AccountValue.key == newest.c.key)
+                      & (AccountValue.currency == newest.c.currency) & (AccountValue.ts == newest.c.ts)))
+            for (row,) in rows:
+                self._latest[(row.account_id, row.key, row.currency)] = (row.value, row.text)
+
+    def update(self, account: str, key: str, val: str, currency: str = "", ts: int = None) -> bool:
+        """Stage val if it changed; returns whether it did."""
+        currency = currency or ""
+        k = (account, key, currency)
+        parsed = _parse(val)
+        with self._lock:
+            if self._latest.get(k) == parsed:
+                return False
+            self._latest[k] = parsed
+            self._pending.append(dict(account_id=account, key=key, currency=currency, ts=ts or int(time.time()), value=parsed[0], text=parsed[1]))
+        return True
+
+    def flush(self) -> int:
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return 0
+        try:
+            with Session(self.engine) as session:
+                # a key that changed twice within one second keeps the last value
+                session.execute(insert(AccountValue).prefix_with("OR REPLACE"), pending)
+                session.commit()
+        except Exception as e:
+            # keep the batch for the next flush; this runs on the reader thread, so don't raise
+            with self._lock:
+                self._pending = pending + self._pending
+            logger.error(f"Could not record {len(pending)} account value changes: {e}")
+            return 0
+        logger.debug(f"Recorded {len(pending)} account value changes")
+        return len(pending)
+
+    def get(self, account: str, key: str, currency: str = "USD", default=None) -> Decimal | str | None:
+        latest = self._latest.get((account, key, currency or ""))
+        if latest is None:
+            return default
+        return _unpack(*latest)
+
+    def keys(self, account: str) -> List[Tuple[str, str]]:
+        return sorted((key, currency) for acct, key, currency in self._latest if acct == account)
+
+    def history(self, account: str, key: str, currency: str = "USD", since: int = 0) -> List[Tuple[int, Decimal | str]]:
+        """Every recorded change after since, oldest first; staged rows are flushed first."""
+        self.flush()
+        with Session(self.engine) as session:
+            rows = session.scalars(select(AccountValue).where(
+                AccountValue.account_id == account, AccountValue.key == key,
+                AccountValue.currency == (currency or ""), AccountValue.ts > since).order_by(AccountValue.ts))
+            return [(row.ts, _unpack(row.value, row.text)) for row in rows]
+
+    def as_of(self, account: str, key: str, ts: int, currency: str = "USD") -> Decimal | str | None:
+        self.flush()
+        with Session(self.engine) as session:
+            row = session.scalars(select(AccountValue).where(
+                AccountValue.account_id == account, AccountValue.key == key,
+                AccountValue.currency == (currency or ""), AccountValue.ts <= ts).order_by(AccountValue.ts.desc()).limit(1)).first()
+        if row is None:
+            return None
+        return _unpack(row.value, row.text)
@@ -0,0 +1,265 @@
+import asyncio
+import threading
+from typing import AsyncIterator, Dict, List, Tuple
+from api.models import Position
+from api.strategy import twsStrategy
+from etl.yahoo_finance import get_analyst_target_mean
+from ibapi.common import ListOfContractDescription, TickAttrib, TickerId
+from ibapi.contract import Contract
+from ibapi.order import Order
+from ibapi.ticktype import TickType
+from ibapi.utils import iswrapper
+from sqlalchemy.orm import Session
+import logging
+
+logger = logging.getLogger('tws-alpha')
+
+TERMINAL_ORDER_STATES = ("Filled", "Cancelled", "ApiCancelled", "Inactive")
+
+class twsAsync(twsStrategy):
+    """
+    asyncio facade over twsStrategy.
+
+    The ibapi message loop runs in its own thread; responses are handed back to
+    the event loop with call_soon_threadsafe, keyed by reqId (or orderId).
+
+        app = twsAsync()
+        await app.connect_async("localhost", 7490, clientId=0)
+        prices = await app.market_data_many(contracts)
+    """
+    def __init__(self, *args, **kwargs) -> None:
+        self.loop: asyncio.AbstractEventLoop = None
+        self._ready: asyncio.Future = None
+        self._thread: threading.Thread = None
+        self._futures: Dict[int, asyncio.Future] = {}
+        self._streams: Dict[int, asyncio.Queue] = {}
+        self._positions: List[Tuple[str, Contract, float, float]] = []
+        self._positions_future: asyncio.Future = None
+        self._positions_lock: asyncio.Lock = None
+        super().__init__(*args, **kwargs)
+
+    async def connect_async(self, host: str, port: int, clientId: int, timeout: float = 10.0):
+        self.loop = asyncio.get_running_loop()
+        self._ready = self.loop.create_future()
+
+        await self.loop.run_in_executor(None, self.connect, host, port, clientId)
+        self._thread = threading.Thread(target=self.run, name="tws-run", daemon=True)
+        self._thread.start()
+        await asyncio.wait_for(self._ready, timeout)
+
+    async def disconnect_async(self):
+        self.stop()
+        if self._thread:
+            await self.loop.run_in_executor(None, self._thread.join)
+
+    # -- bridging helpers ----------------------------------------------------
+    # _register and _open_stream create loop objects and must run on the event
+    # loop; _resolve, _fail and _push hand results over from the reader thread.
+
+    def _register(self, reqId: int) -> asyncio.Future:
+        fut = self.loop.create_future()
+        self._futures[reqId] = fut
+        return fut
+
+    def _open_stream(self, reqId: int) -> asyncio.Queue:
+        queue = asyncio.Queue()
+        self._streams[reqId] = queue
+        return queue
+
+    def _resolve(self, fut: asyncio.Future, value):
+        if fut is not None and self.loop is not None:
+            self.loop.call_soon_threadsafe(_set_result, fut, value)
+
+    def _fail(self, fut: asyncio.Future, exc: Exception):
+        if fut is not None and self.loop is not None:
+            self.loop.call_soon_threadsafe(_set_exception, fut, exc)
+
+    def _push(self, reqId: int, item):
+        queue = self._streams.get(reqId)
+        if queue is not None and self.loop is not None:
+            self.loop.call_soon_threadsafe(queue.put_nowait, item)
+
+    # -- requests ------------------------------------------------------------
+
+    async def market_data(self, contract: Contract, genericTickList: str = "", snapshot: bool = False, timeout: float = 10.0) -> float:
+        """First valid price for contract. Raises LookupError if it isn't tracked in the position table."""
+        reqId = self.nextOrderId()
+        fut = self._register(reqId)
+        sent = False
+        try:
+            sent = await self._request_market_data(reqId, contract, genericTickList, snapshot)
+            return await asyncio.wait_for(fut, timeout)
+        finally:
+            self._futures.pop(reqId, None)
+            if sent and not snapshot:
+                self.cancelMktData(reqId)
+
+    async def market_data_many(self, contracts: List[Contract], concurrency: int = 4, timeout: float = 10.0) -> Dict[str, float]:
+        """First price per symbol; symbols that time out or error are left out."""
+        sem = asyncio.Semaphore(concurrency)
+
+        async def one(contract: Contract):
+            async with sem:
+                try:
+                    return contract.symbol, await self.market_data(contract, timeout=timeout)
+                except (asyncio.TimeoutError, RuntimeError, LookupError) as e:
+                    logger.warning(f"No market data for {contract.symbol}: {e!r}")
+                    return contract.symbol, None
+
+        results = await asyncio.gather(*(one(c) for c in contracts))
+        return {symbol: price for symbol, price in results if price is not None}
+
+    async def stream_market_data(self, contract: Contract, genericTickList: str = "") -> AsyncIterator[Tuple[TickType, float]]:
+        reqId = self.nextOrderId()
+        queue = self._open_stream(reqId)
+        sent = False
+        try:
+            sent = await self._request_market_data(reqId, contract, genericTickList, False)
+            while True:
+                item = await queue.get()
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            self._streams.pop(reqId, None)
+            if sent:
+                self.cancelMktData(reqId)
+
+    async def _request_market_data(self, reqId: int, contract: Contract, genericTickList: str, snapshot: bool) -> bool:
+        # twsDatabase.reqMktData only sends for symbols in the position table, so
+        # fail now rather than wait for a tick that will never come
+        await self.loop.run_in_executor(None, self.reqMktData, reqId, contract, genericTickList, snapshot, False, [])
+        if reqId not in self.req_symbols:
+            raise LookupError(f"{contract.symbol} is not tracked in the position table")
+        return True
+
+    async def matching_symbols(self, pattern: str, timeout: float = 10.0) -> ListOfContractDescription:
+        reqId = self.nextOrderId()
+        fut = self._register(reqId)
+        try:
+            await self.loop.run_in_executor(None, self.reqMatchingSymbols, reqId, pattern)
+            return await asyncio.wait_for(fut, timeout)
+        finally:
+            self._futures.pop(reqId, None)
+
+    async def positions(self, timeout: float = 10.0) -> List[Tuple[str, Contract, float, float]]:
+        """(account, contract, position, avgCost) for every account, as of positionEnd."""
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+        if self._positions_lock is None:
+            self._positions_lock = asyncio.Lock()
+        async with self._positions_lock:
+            self._positions = []
+            self._positions_future = self.loop.create_future()
+            try:
+                self.reqPositions()
+                return await asyncio.wait_for(self._positions_future, timeout)
+            finally:
+                self._positions_future = None
+
+    async def place_order(self, contract: Contract, order: Order) -> AsyncIterator[Tuple[str, float, float]]:
+        """Yields (status, filled, remaining) until the order reaches a terminal state."""
+        orderId = self.nextOrderId()
+        queue = self._open_stream(orderId)
+        try:
+            self.placeOrder(orderId, contract, order)
+            while True:
+                item = await queue.get()
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+                if item[0] in TERMINAL_ORDER_STATES:
+                    return
+        finally:
+            self._streams.pop(orderId, None)
+
+    async def refresh_all_async(self, concurrency: int = 4, timeout: float = 10.0):
+        """refresh_all, fanned out: prices and analyst targets fetched concurrently."""
+        with Session(self.engine) as session:
+            contracts = []
+            for obj in session.query(Position).filter(Position.req_id == None):
+                contract = Contract()
+                contract.symbol = obj.symbol
+                contract.primaryExchange = obj.primary_exchange
+                contract.secType = obj.sec_type
+                contract.currency = obj.currency
+                contracts.append(contract)
+
+        sem = asyncio.Semaphore(concurrency)
+
+        async def target(symbol: str):
+            async with sem:
+                return symbol, await self.loop.run_in_executor(None, get_analyst_target_mean, symbol)
+
+        prices, targets = await asyncio.gather(
+            self.market_data_many(contracts, concurrency=concurrency, timeout=timeout),
+            asyncio.gather(*(target(c.symbol) for c in contracts)),
+        )
+
+        with Session(self.engine) as session:
+            refreshed: List[Position] = []
+            for symbol, analyst_target in targets:
+                obj = session.get(Position, symbol)
+                if obj:
+                    obj.analyst_target = analyst_target
+                    session.add(obj)
+                    refreshed.append(obj)
+            changed = self.factors.record(session, refreshed)
+            session.commit()
+        self.factors_changed(changed)
+        logger.info(f"Refreshed {len(prices)}/{len(contracts)} prices")
+        return prices
+
+    # -- callbacks, reader thread --------------------------------------------
+
+    @iswrapper
+    def nextValidId(self, orderId: int):
+        super().nextValidId(orderId)
+        if self._ready is not None and not self._ready.done():
+            self._resolve(self._ready, orderId)
+
+    def error(self, reqId: TickerId, errorCode: int, errorString: str, advancedOrderRejectJson=""):
+        super().error(reqId, errorCode, errorString, advancedOrderRejectJson)
+        if reqId < 0 or 2100 <= errorCode < 2200:
+            return
+        exc = RuntimeError(f"{errorCode}: {errorString}")
+        self._fail(self._futures.get(reqId), exc)
+        self._push(reqId, exc)
+
+    @iswrapper
+    def tickPrice(self, reqId: TickerId, tickType: TickType, price: float, attrib: TickAttrib):
+        super().tickPrice(reqId, tickType, price, attrib)
+        if not price or price == -1:
+            return
+        self._resolve(self._futures.get(reqId), price)
+        self._push(reqId, (tickType, price))
+
+    @iswrapper
+    def symbolSamples(self, reqId: int, contractDescriptions: ListOfContractDescription):
+        super().symbolSamples(reqId, contractDescriptions)
+        self._resolve(self._futures.get(reqId), contractDescriptions)
+
+    @iswrapper
+    def position(self, account: str, contract: Contract, position, avgCost: float):
+        super().position(account, contract, position, avgCost)
+        if self._positions_future is not None:
+            self._positions.append((account, contract, position, avgCost))
+
+    @iswrapper
+    def positionEnd(self):
+        super().positionEnd()
+        self._resolve(self._positions_future, list(self._positions))
+
+    @iswrapper
+    def orderStatus(self, orderId, status: str, filled, remaining, avgFillPrice: float, permId: int, parentId: int, lastFillPrice: float, clientId: int, whyHeld: str, mktCapPrice: float):
+        super().orderStatus(orderId, status, filled, remaining, avgFillPrice, permId, parentId, lastFillPrice, clientId, whyHeld, mktCapPrice)
+        self._push(orderId, (status, filled, remaining))
+
+
+def _set_result(fut: asyncio.Future, value):
+    if not fut.done():
+        fut.set_result(value)
+
+def _set_exception(fut: asyncio.Future, exc: Exception):
+    if not fut.done():
+        fut.set_exception(exc)
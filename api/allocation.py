@@ -0,0 +1,213 @@
+from typing import Callable, Dict, List, NamedTuple
+import numpy as np
+import logging
+
+logger = logging.getLogger('tws-alpha')
+
+class Candidates(NamedTuple):
+    symbols: List[str]
+    scores: np.ndarray
+    current: np.ndarray
+    sectors: List[str | None]
+    covariance: np.ndarray | None = None
+
+
+def score_proportional(c: Candidates, **kwargs) -> np.ndarray:
+    w = np.clip(c.scores, 0, None)
+    return w / w.sum() if w.sum() > 0 else np.full(len(w), 1 / len(w))
+
+def risk_parity(c: Candidates, iterations: int = 100, tol: float = 1e-8, **kwargs) -> np.ndarray:
+    """Equal risk contribution by multiplicative fixed-point iteration, starting from inverse volatility."""
+    cov = _covariance(c)
+    w = 1 / np.sqrt(np.diag(cov))
+    w /= w.sum()
+    target = 1 / len(w)
+    for _ in range(iterations):
+        rc = w * (cov @ w)
+        rc /= rc.sum()
+        step = np.sqrt(target / np.maximum(rc, 1e-12))
+        w_next = w * step
+        w_next /= w_next.sum()
+        if np.abs(w_next - w).max() < tol:
+            return w_next
+        w = w_next
+    return w
+
+def mean_variance(c: Candidates, risk_aversion: float = 4.0, alpha: float = .05, iterations: int = 200, position_cap: float = 1.0, sector_cap: float = 1.0, turnover_penalty: float = 0.0, **kwargs) -> np.ndarray:
+    """
+    max mu'w - risk_aversion/2 w'Cw - turnover_penalty |w - current|_1 over the
+    capped simplex, by proximal projected gradient. Expected returns are the
+    standardized scores scaled by alpha.
+    """
+    cov = _covariance(c)
+    sd = c.scores.std()
+    mu = alpha * (c.scores - c.scores.mean()) / (sd if sd > 0 else 1)
+    step = 1 / (risk_aversion * _spectral_bound(cov))
+
+    w = project(score_proportional(c), position_cap, c.sectors, sector_cap)
+    for _ in range(iterations):
+        grad = mu - risk_aversion * (cov @ w)
+        v = _shrink_toward(w + step * grad, c.current, step * turnover_penalty)
+        w_next = project(v, position_cap, c.sectors, sector_cap)
+        if np.abs(w_next - w).max() < 1e-9:
+            return w_next
+        w = w_next
+    return w
+
+STRATEGIES: Dict[str, Callable[..., np.ndarray]] = {
+    "score": score_proportional,
+    "risk_parity": risk_parity,
+    "mean_variance": mean_variance,
+}
+
+def allocate(c: Candidates, strategy: str = "score", position_cap: float = .2, sector_cap: float = .4, turnover_penalty: float = 0.0, max_positions: int | None = None, **kwargs) -> np.ndarray:
+    """
+    Target weights for every candidate, summing to 1 where the caps allow.
+
+    With max_positions set, only the top max_positions by score get weight,
+    skipping names whose sector is already full (see _select), so the sector
+    cap moves weight to the next candidates instead of leaving it unallocated.
+    Without it every candidate is kept and project() alone enforces the caps. Strategies other than
+    mean_variance apply the turnover penalty as a soft-threshold toward current
+    weights before the caps are enforced.
+
+    When max_positions * position_cap <= 1 every kept name ends up at the cap
+    (or its sector's share of it), so all strategies give the same weights;
+    they only differ when there is room to spread, e.g. max_positions=None.
+    """
+    n = len(c.symbols)
+    if not n:
+        return np.zeros(0)
+
+    keep = _select(c, max_positions, position_cap, sector_cap)
+    sub = Candidates(
+        symbols=[c.symbols[i] for i in keep],
+        scores=c.scores[keep],
+        current=c.current[keep],
+        sectors=[c.sectors[i] for i in keep],
+        covariance=None if c.covariance is None else c.covariance[np.ix_(keep, keep)],
+    )
+
+    solver = STRATEGIES[strategy]
+    if solver is mean_variance:
+        w = solver(sub, position_cap=position_cap, sector_cap=sector_cap, turnover_penalty=turnover_penalty, **kwargs)
+    else:
+        w = _shrink_toward(solver(sub, **kwargs), sub.current, turnover_penalty)
+        w = project(w, position_cap, sub.sectors, sector_cap)
+
+    weights = np.zeros(n)
+    weights[keep] = w
+    return weights
+
+def _select(c: Candidates, max_positions: int | None, position_cap: float, sector_cap: float) -> np.ndarray:
+    """
+    Indices of the names to allocate over: all of them without max_positions,
+    otherwise the best max_positions by score where each sector takes at most
+    as many names as fit under sector_cap at full position_cap. Unknown (None)
+    sectors are not limited.
+    """
+    n = len(c.symbols)
+    if not max_positions:
+        return np.arange(n)
+    if sector_cap >= 1 or position_cap <= 0:
+        room = n
+    else:
+        room = max(1, int(sector_cap / position_cap + 1e-9))
+    taken: Dict[str, int] = {}
+    keep = []
+    for i in np.argsort(-c.scores, kind="stable"):
+        if len(keep) >= max_positions:
+            break
+        sector = c.sectors[i]
+        if sector is not None:
+            if taken.get(sector, 0) >= room:
+                continue
+            taken[sector] = taken.get(sector, 0) + 1
+        keep.append(i)
+    return np.sort(np.array(keep, dtype=int))
+
+def project(v: np.ndarray, position_cap: float, sectors: List[str | None] = None, sector_cap: float = 1.0, budget: float = 1.0, rounds: int = 10) -> np.ndarray:
+    """
+    Approximate Euclidean projection onto {0 <= w <= cap, sum(w) = budget} with
+    per-sector sums <= sector_cap. Sectors over their cap have their members'
+    upper bounds scaled down and the box/simplex projection is repeated.
+    Unknown (None) sectors are not capped.
+    """
+    upper = np.full(len(v), position_cap, dtype=float)
+    codes = _sector_codes(sectors, len(v))
+    w = _project_box_simplex(v, upper, budget)
+    if sector_cap >= budget or codes.max(initial=-1) < 0:
+        return w
+
+    known = codes >= 0
+    for _ in range(rounds):
+        totals = np.bincount(codes[known], weights=w[known])
+        over = totals > sector_cap + 1e-12
+        if not over.any():
+            break
+        scale = np.ones(len(totals))
+        scale[over] = sector_cap / totals[over]
+        hit = known & over[np.maximum(codes, 0)]
+        upper[hit] = w[hit] * scale[codes[hit]]
+        w = _project_box_simplex(v, upper, min(budget, upper.sum()))
+    return w
+
+def _project_box_simplex(v: np.ndarray, upper: np.ndarray, budget: float) -> np.ndarray:
+    """clip(v - lam, 0, upper) with lam found by bisection so the sum is budget."""
+    if upper.sum() <= budget:
+        return upper.copy()
+    lo, hi = v.min() - upper.max() - 1, v.max()
+    for _ in range(60):
+        lam = (lo + hi) / 2
+        if np.clip(v - lam, 0, upper).sum() > budget:
+            lo = lam
+        else:
+            hi = lam
+    return np.clip(v - hi, 0, upper)
+
+def _shrink_toward(w: np.ndarray, current: np.ndarray, penalty: float) -> np.ndarray:
+    """Soft-threshold w - current by penalty: trades smaller than the penalty are not made."""
+    if penalty <= 0:
+        return w
+    d = w - current
+    return current + np.sign(d) * np.maximum(np.abs(d) - penalty, 0)
+
+def _covariance(c: Candidates) -> np.ndarray:
+    if c.covariance is not None:
+        return c.covariance + np.eye(len(c.scores)) * 1e-10
+    return np.eye(len(c.scores))
+
+def _spectral_bound(cov: np.ndarray) -> float:
+    """Cheap upper bound on the largest eigenvalue (max absolute row sum)."""
+    return max(float(np.abs(cov).sum(axis=1).max()), 1e-12)
+
+def _sector_codes(sectors: List[str | None], n: int) -> np.ndarray:
+    if not sectors:
+        return np.full(n, -1)
+    names: Dict[str, int] = {}
+    return np.array([-1 if s is None else names.setdefault(s, len(names)) for s in sectors])
+
+def build_candidates(positions: list, current: np.ndarray, known: List[str], covariance: np.ndarray) -> Candidates:
+    """Candidates from Position-like rows (symbol, quant_rating, sector)."""
+    symbols = [position.symbol for position in positions]
+    return Candidates(
+        symbols=symbols,
+        scores=np.array([position.quant_rating for position in positions], dtype=float),
+        current=np.asarray(current, dtype=float),
+        sectors=[position.sector for position in positions],
+        covariance=fill_covariance(symbols, known, covariance),
+    )
+
+def fill_covariance(symbols: List[str], known: List[str], covariance: np.ndarray) -> np.ndarray:
+    """
+    Embed a covariance over known symbols into one over symbols. Symbols with no
+    history get the median known variance and zero correlation.
+    """
+    n = len(symbols)
+    fill = float(np.median(np.diag(covariance))) if len(known) else 1.0
+    cov = np.eye(n) * fill
+    index = {s: i for i, s in enumerate(known)}
+    src = np.array([index.get(s, -1) for s in symbols])
+    have = np.flatnonzero(src >= 0)
+    cov[np.ix_(have, have)] = covariance[np.ix_(src[have], src[have])]
+    return cov
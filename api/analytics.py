@@ -0,0 +1,215 @@
+from typing import Dict, List, NamedTuple
+import numpy as np
+from api.history import BarStore
+import logging
+
+logger = logging.getLogger('tws-alpha')
+
+class Snapshot(NamedTuple):
+    version: int
+    symbols: List[str]
+    prices: np.ndarray
+    weights: np.ndarray
+    volatility: np.ndarray
+    covariance: np.ndarray
+    correlation: np.ndarray
+    beta: np.ndarray
+    max_drawdown: np.ndarray
+    portfolio_volatility: float
+    portfolio_drawdown: float
+    portfolio_max_drawdown: float
+
+    def row(self, symbol: str) -> Dict[str, float]:
+        i = self.symbols.index(symbol)
+        return dict(
+            weight=float(self.weights[i]),
+            volatility=float(self.volatility[i]),
+            beta=float(self.beta[i]),
+            max_drawdown=float(self.max_drawdown[i]),
+        )
+
+
+class PortfolioAnalytics:
+    """
+    Risk metrics over a symbols x time matrix of closes from the BarStore.
+
+    Log returns over a rolling window are kept as running first and second
+    moments, so a new bar updates the covariance in O(n^2) and a tick costs O(1)
+    instead of a rebuild.
+    snapshot() derives weights, volatility, covariance, correlation, beta
+    (against the portfolio itself) and drawdowns, cached until something changes.
+    Drawdowns cover the closes in the window plus ticks since the last bar.
+    """
+    def __init__(self, store: BarStore, bar_size: str = "1 day", window: int = 252, periods_per_year: int = 252):
+        self.store = store
+        self.bar_size = bar_size
+        self.window = window
+        self.periods_per_year = periods_per_year
+        self.symbols: List[str] = []
+        self.index: Dict[str, int] = {}
+        self.last_ts: int = None
+        self.version = 0
+        self._snapshot: Snapshot = None
+        self.load({})
+
+    def load(self, quantities: Dict[str, float]):
+        """Build the matrix from stored bars for every symbol in quantities (0 for watchlist)."""
+        series = {symbol: self.store.read(symbol, self.bar_size) for symbol in quantities}
+        self.symbols = [symbol for symbol, bars in series.items() if len(bars) > 1]
+        self.index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.quantities = np.array([float(quantities[s]) for s in self.symbols])
+        n = len(self.symbols)
+
+        if n:
+            ts = np.unique(np.concatenate([series[s]["ts"][-(self.window + 1):] for s in self.symbols]))[-(self.window + 1):]
+            closes = np.full((len(ts), n), np.nan)
+            for j, symbol in enumerate(self.symbols):
+                bars = series[symbol]
+                pos = np.searchsorted(ts, bars["ts"])
+                ok = (pos < len(ts)) & (ts[np.minimum(pos, len(ts) - 1)] == bars["ts"])
+                closes[pos[ok], j] = bars["close"][ok]
+            complete = ~np.isnan(_ffill(closes)).any(axis=1)
+            closes = _ffill(closes)[complete]
+            self.last_ts = int(ts[complete][-1]) if complete.any() else None
+        else:
+            closes = np.empty((0, 0))
+            self.last_ts = None
+
+        self.closes = closes
+        self.prices = closes[-1].copy() if len(closes) else np.zeros(n)
+        self.returns = np.diff(np.log(closes), axis=0) if len(closes) > 1 else np.empty((0, n))
+
+        self._n = len(self.returns)
+        self._sum = self.returns.sum(axis=0)
+        self._sum_sq = self.returns.T @ self.returns
+
+        self._window_drawdowns()
+        self._touch()
+        logger.debug(f"Analytics loaded {n} symbols x {len(closes)} bars")
+
+    def on_tick(self, symbol: str, price: float):
+        i = self.index.get(symbol)
+        if i is None or not price or price <= 0:
+            return
+        self.prices[i] = price
+        if price > self._peak[i]:
+            self._peak[i] = price
+        else:
+            self._max_dd[i] = max(self._max_dd[i], 1 - price / self._peak[i])
+        self._update_equity()
+        self._touch()
+
+    def can_roll(self, symbols, ts: int) -> bool:
+        """Whether bars for symbols from ts on can go through on_bar rather than a reload."""
+        return bool(len(self.closes)) and self.last_ts is not None and ts > self.last_ts and all(s in self.index for s in symbols)
+
+    def on_bar(self, closes: Dict[str, float], ts: int = None):
+        """Roll the window forward by one closed bar. Symbols missing from closes carry forward."""
+        if not self.symbols or not len(self.closes):
+            return
+        if ts is not None:
+            if self.last_ts is not None and ts <= self.last_ts:
+                return
+            self.last_ts = ts
+        row = self.closes[-1].copy()
+        for symbol, close in closes.items():
+            i = self.index.get(symbol)
+            if i is not None and close > 0:
+                row[i] = close
+        r = np.log(row / self.closes[-1])
+
+        self.returns = np.vstack((self.returns, r))
+        self.closes = np.vstack((self.closes, row))
+        self._n += 1
+        self._sum += r
+        self._sum_sq += np.outer(r, r)
+        if self._n > self.window:
+            old = self.returns[0]
+            self._sum -= old
+            self._sum_sq -= np.outer(old, old)
+            self._n -= 1
+            self.returns = self.returns[1:]
+            self.closes = self.closes[1:]
+
+        self.prices = row.copy()
+        self._window_drawdowns()
+        self._touch()
+
+    def set_quantity(self, symbol: str, quantity: float):
+        i = self.index.get(symbol)
+        if i is not None:
+            self.quantities[i] = float(quantity)
+            self._touch()
+
+    def snapshot(self) -> Snapshot:
+        if self._snapshot is not None and self._snapshot.version == self.version:
+            return self._snapshot
+
+        n = len(self.symbols)
+        values = self.quantities * self.prices
+        total = values.sum()
+        weights = values / total if total else np.zeros(n)
+
+        if self._n > 1:
+            cov = (self._sum_sq - np.outer(self._sum, self._sum) / self._n) / (self._n - 1)
+        else:
+            cov = np.zeros((n, n))
+        sd = np.sqrt(np.clip(np.diag(cov), 0, None))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            corr = np.where(np.outer(sd, sd) > 0, cov / np.outer(sd, sd), 0.0)
+            port_var = float(weights @ cov @ weights)
+            beta = (cov @ weights) / port_var if port_var > 0 else np.zeros(n)
+
+        equity = float(values.sum())
+        self._snapshot = Snapshot(
+            version=self.version,
+            symbols=list(self.symbols),
+            prices=self.prices.copy(),
+            weights=weights,
+            volatility=sd * np.sqrt(self.periods_per_year),
+            covariance=cov * self.periods_per_year,
+            correlation=corr,
+            beta=beta,
+            max_drawdown=self._max_dd.copy(),
+            portfolio_volatility=float(np.sqrt(max(port_var, 0) * self.periods_per_year)),
+            portfolio_drawdown=1 - equity / self._equity_peak if self._equity_peak else 0.0,
+            portfolio_max_drawdown=self._equity_max_dd,
+        )
+        return self._snapshot
+
+    def _window_drawdowns(self):
+        """Peaks and max drawdowns over the closes in the window, the same whether it was loaded or rolled."""
+        closes = self.closes
+        n = len(self.symbols)
+        self._peak = np.nanmax(closes, axis=0) if len(closes) else np.zeros(n)
+        self._max_dd = _max_drawdown(closes) if len(closes) else np.zeros(n)
+        equity = closes @ self.quantities if len(closes) else np.zeros(1)
+        self._equity_peak = float(equity.max()) if len(equity) else 0.0
+        self._equity_max_dd = float(_max_drawdown(equity[:, None])[0]) if len(equity) else 0.0
+
+    def _update_equity(self):
+        equity = float(self.quantities @ self.prices)
+        if equity > self._equity_peak:
+            self._equity_peak = equity
+        elif self._equity_peak:
+            self._equity_max_dd = max(self._equity_max_dd, 1 - equity / self._equity_peak)
+
+    def _touch(self):
+        self.version += 1
+
+
+def _ffill(matrix: np.ndarray) -> np.ndarray:
+    """Forward-fill NaNs down each column."""
+    mask = np.isnan(matrix)
+    idx = np.where(~mask, np.arange(len(matrix))[:, None], 0)
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    return matrix[idx, np.arange(matrix.shape[1])]
+
+def _max_drawdown(closes: np.ndarray) -> np.ndarray:
+    """Largest peak-to-trough fall per column, as a fraction of the peak."""
+    if not len(closes):
+        return np.zeros(closes.shape[1])
+    peaks = np.maximum.accumulate(closes, axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dd = np.where(peaks > 0, 1 - closes / peaks, 0.0)
+    return dd.max(axis=0)
@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+"""
+Offline backtester for the sell rules and the rebalance allocation.
+
+Closes come from the BarStore; factor values (ratings, grades, analyst target)
+come from a FactorSource. Each bar, held symbols are wrapped in transient
+Position objects and run through the same sell_bad_quants /
+sell_above_analyst_target / rebalance_candidates / allocate code used live.
+Fills are at the bar close plus slippage, with IB-style per-share commission.
+
+    python -m api.backtest --quant-threshold 3.5 4 4.5 --target-ratio .9 .95 1
+    python -m api.backtest --synthetic 200 --workers 8 --quant-threshold 3 4 --max-positions 5 10 --position-cap .1 .2
+"""
+import argparse
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple
+import numpy as np
+from prettytable import PrettyTable
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from api.allocation import allocate, build_candidates
+from api.conf import Config
+from api.factors import FactorHistory, as_of_timeline
+from api.history import BarStore, synthetic_bars
+from api.models import FACTOR_FIELDS, Position
+from api.recommendations import rebalance_candidates, sell_above_analyst_target, sell_bad_quants
+import logging
+
+logger = logging.getLogger('tws-alpha')
+
+class BacktestConfig(NamedTuple):
+    quant_threshold: float = 4
+    target_ratio: float = .95
+    rebalance_every: int = 21
+    min_score: float = 13
+    strategy: str = "score"
+    position_cap: float = .2
+    sector_cap: float = .4
+    turnover_penalty: float = 0.0
+    max_positions: int | None = 5
+    cash: float = 100_000.0
+    commission_per_share: float = .005
+    min_commission: float = 1.0
+    slippage_bps: float = 5.0
+    risk_window: int = 60
+
+
+class FactorSource:
+    """
+    Factor values as of a timestamp. With a timeline (from FactorHistory) each
+    symbol's values are the last snapshot at or before ts; without one they are
+    the constant values on file today. History only starts with the first
+    load or refresh that recorded it, so a symbol isn't tradable before its
+    first snapshot unless backfill is set, which uses that snapshot for the
+    earlier bars (look-ahead: opt in knowingly). Symbols with no snapshots use
+    today's values.
+    """
+    def __init__(self, factors: Dict[str, Dict[str, float]], static: Dict[str, Dict[str, str]] = None, timeline: dict = None, backfill: bool = False):
+        self.factors = factors
+        self.static = static or {}
+        self.timeline = timeline
+        self.backfill = backfill
+        self._untracked = {s: v for s, v in factors.items() if not timeline or s not in timeline}
+
+    def at(self, ts: int) -> Dict[str, Dict[str, float]]:
+        if self.timeline:
+            return {**self._untracked, **as_of_timeline(self.timeline, ts, backfill=self.backfill)}
+        return self.factors
+
+    @classmethod
+    def from_db(cls, db_url: str = Config.DB_URL, history: bool = True, backfill: bool = False):
+        engine = create_engine(db_url)
+        with Session(engine) as session:
+            rows = session.query(Position).all()
+            factors = {p.symbol: {f: getattr(p, f) for f in FACTOR_FIELDS} for p in rows}
+            static = {p.symbol: dict(primary_exchange=p.primary_exchange, sector=p.sector) for p in rows}
+        return cls(factors, static, FactorHistory(engine).timeline() if history else None, backfill)
+
+
+class Result(NamedTuple):
+    config: BacktestConfig
+    total_return: float
+    annual_return: float
+    max_drawdown: float
+    turnover: float
+    trades: int
+    commission: float
+
+
+def load_closes(store: BarStore, symbols: List[str], bar_size: str = "1 day", start: int = None, end: int = None):
+    """(ts, closes) aligned on the union of bar times, forward-filled; NaN before a symbol's first bar."""
+    series = {s: store.read(s, bar_size, start, end) for s in symbols}
+    symbols = [s for s in symbols if len(series[s])]
+    if not symbols:
+        return symbols, np.empty(0, dtype=np.int64), np.empty((0, 0))
+    ts = np.unique(np.concatenate([series[s]["ts"] for s in symbols]))
+    closes = np.full((len(ts), len(symbols)), np.nan)
+    for j, s in enumerate(symbols):
+        closes[np.searchsorted(ts, series[s]["ts"]), j] = series[s]["close"]
+    mask = np.isnan(closes)
+    idx = np.where(~mask, np.arange(len(ts))[:, None], 0)
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    return symbols, ts, closes[idx, np.arange(len(symbols))]
+
+def run(config: BacktestConfig, symbols: List[str], ts: np.ndarray, closes: np.ndarray, factors: FactorSource, periods_per_year: int = 252) -> Result:
+    n = len(symbols)
+    qty = np.zeros(n)
+    cash = config.cash
+    equity = np.empty(len(ts))
+    traded = commission = 0.0
+    trades = 0
+    slip = config.slippage_bps / 1e4
+    opts = dict(strategy=config.strategy, position_cap=config.position_cap, sector_cap=config.sector_cap,
+                turnover_penalty=config.turnover_penalty, max_positions=config.max_positions)
+
+    def trade(j: int, shares: float, price: float):
+        nonlocal cash, traded, commission, trades
+        if not shares:
+            return
+        fill = price * (1 + slip if shares > 0 else 1 - slip)
+        fee = max(config.min_commission, abs(shares) * config.commission_per_share)
+        qty[j] += shares
+        cash -= shares * fill + fee
+        traded += abs(shares) * fill
+        commission += fee
+        trades += 1
+
+    for t in range(len(ts)):
+        prices = closes[t]
+        live = ~np.isnan(prices)
+        snapshot = factors.at(int(ts[t]))
+        positions = _positions(symbols, prices, snapshot, factors.static)
+
+        held = [positions[j] for j in np.flatnonzero(qty > 0) if j in positions]
+        sold = {p.index for p in sell_bad_quants(held, config.quant_threshold) + sell_above_analyst_target(held, config.target_ratio)}
+        for j in sold:
+            trade(j, -qty[j], prices[j])
+
+        if t % config.rebalance_every == 0:
+            value = cash + np.nansum(qty * prices)
+            candidates = [p for p in rebalance_candidates(list(positions.values()), config.min_score) if p.index not in sold]
+            if candidates:
+                cols = np.array([p.index for p in candidates])
+                window = closes[max(0, t - config.risk_window):t + 1][:, cols]
+                cov = _covariance(window) * periods_per_year
+                current = np.nan_to_num(qty[cols] * prices[cols]) / value if value > 0 else np.zeros(len(cols))
+                weights = allocate(build_candidates(candidates, current, [p.symbol for p in candidates], cov), **opts)
+                target = np.zeros(n)
+                target[cols] = np.floor(weights * value / prices[cols])
+            else:
+                target = np.zeros(n)
+            # sells first so the cash is there for the buys
+            diff = np.where(live, target - qty, 0)
+            for j in np.flatnonzero(diff < 0):
+                trade(j, diff[j], prices[j])
+            for j in np.flatnonzero(diff > 0):
+                trade(j, diff[j], prices[j])
+
+        equity[t] = cash + np.nansum(qty * prices)
+
+    if not len(equity):
+        return Result(config, 0.0, 0.0, 0.0, 0.0, 0, 0.0)
+    peaks = np.maximum.accumulate(equity)
+    total = equity[-1] / config.cash - 1
+    years = max(len(equity) / periods_per_year, 1 / periods_per_year)
+    return Result(
+        config=config,
+        total_return=float(total),
+        annual_return=float((1 + total) ** (1 / years) - 1) if total > -1 else -1.0,
+        max_drawdown=float((1 - equity / peaks).max()),
+        turnover=float(traded / 2 / equity.mean() / years),
+        trades=trades,
+        commission=float(commission),
+    )
+
+def _positions(symbols: List[str], prices: np.ndarray, factors: Dict[str, Dict[str, float]], static: Dict[str, Dict[str, str]]) -> Dict[int, Position]:
+    """Transient (never added to a session) Position rows for symbols priced this bar."""
+    out = {}
+    for j, symbol in enumerate(symbols):
+        if np.isnan(prices[j]) or symbol not in factors:
+            continue
+        obj = Position(symbol=symbol, last_trade=float(prices[j]), **factors[symbol], **static.get(symbol, {}))
+        obj.index = j
+        out[j] = obj
+    return out
+
+def _covariance(window: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = np.diff(np.log(window), axis=0)
+    r = np.nan_to_num(r)
+    if len(r) < 2:
+        return np.eye(window.shape[1]) * 1e-4
+    return np.cov(r, rowvar=False).reshape(window.shape[1], window.shape[1])
+
+# process pool workers load their own (memory-mapped) data once
+_worker: dict = {}
+
+def _init_worker(root: str, symbols: List[str], bar_size: str, factors: FactorSource):
+    logging.getLogger('tws-alpha').setLevel(logging.ERROR)
+    _worker["data"] = load_closes(BarStore(root), symbols, bar_size)
+    _worker["factors"] = factors
+
+def _run_worker(config: BacktestConfig) -> Result:
+    symbols, ts, closes = _worker["data"]
+    return run(config, symbols, ts, closes, _worker["factors"])
+
+def sweep(grid: Dict[str, list], root, symbols: List[str], factors: FactorSource, base: BacktestConfig = BacktestConfig(), bar_size: str = "1 day", workers: int = None) -> List[Result]:
+    """Run every combination in grid (field -> values) over a process pool."""
+    keys = list(grid)
+    configs = [base._replace(**dict(zip(keys, values))) for values in itertools.product(*(grid[k] for k in keys))]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(str(root), symbols, bar_size, factors)) as pool:
+        return list(pool.map(_run_worker, configs))
+
+def synthetic_universe(root, count: int, bars: int = 756, seed: int = 0, refresh_every: int = 21) -> FactorSource:
+    """
+    Random-walk bars under root and a factor timeline for each symbol: ratings
+    drift every refresh_every bars and the analyst target is re-set off the
+    close at that bar, for running without a database.
+    """
+    rng = np.random.default_rng(seed)
+    store = BarStore(root)
+    factors, static, timeline = {}, {}, {}
+    for i in range(count):
+        symbol = f"SYN{i:04d}"
+        b = synthetic_bars(bars, price=float(rng.uniform(10, 300)), volatility=float(rng.uniform(.01, .04)), seed=seed + i)
+        store.append(symbol, "1 day", b)
+        ratings = rng.uniform(2, 5, 3)
+        times, values = [], []
+        for t in range(0, bars, refresh_every):
+            ratings = np.clip(ratings + rng.normal(0, .3, 3), 1, 5)
+            times.append(int(b["ts"][t]))
+            values.append(dict(
+                quant_rating=float(ratings[0]), author_rating=float(ratings[1]), analyst_rating=float(ratings[2]),
+                valuation=0.0, growth=0.0, profitability=0.0, momentum=0.0, epsrevision=0.0,
+                analyst_target=float(b["close"][t] * rng.uniform(.9, 1.4)),
+            ))
+        timeline[symbol] = (times, values)
+        factors[symbol] = values[-1]
+        static[symbol] = dict(primary_exchange="NASDAQ", sector=f"SECTOR{i % 11}")
+    return FactorSource(factors, static, timeline)
+
+def main():
+    cmd = argparse.ArgumentParser("tws-alpha backtest")
+    cmd.add_argument("--quant-threshold", type=float, nargs="+", default=[4])
+    cmd.add_argument("--target-ratio", type=float, nargs="+", default=[.95])
+    cmd.add_argument("--rebalance-every", type=int, nargs="+", default=[21])
+    cmd.add_argument("--strategy", type=str, nargs="+", default=[Config.ALLOCATION["strategy"]])
+    cmd.add_argument("--max-positions", type=int, nargs="+", default=[BacktestConfig.max_positions], help="0 for no limit")
+    cmd.add_argument("--position-cap", type=float, nargs="+", default=[BacktestConfig.position_cap])
+    cmd.add_argument("--bar-size", type=str, default="1 day")
+    cmd.add_argument("--bars", type=str, default=str(Config.BARS_PATH), help="bar store root")
+    cmd.add_argument("--db", type=str, default=Config.DB_URL, help="factor source database")
+    cmd.add_argument("--static-factors", action="store_true", default=False, help="use today's factors for every bar instead of the factor history")
+    cmd.add_argument("--backfill-factors", action="store_true", default=False, help="use each symbol's first snapshot for bars before it (look-ahead)")
+    cmd.add_argument("--synthetic", type=int, default=0, help="generate this many synthetic symbols under --bars instead")
+    cmd.add_argument("--workers", type=int, default=os.cpu_count())
+    args = cmd.parse_args()
+
+    if args.synthetic:
+        factors = synthetic_universe(args.bars, args.synthetic)
+    else:
+        factors = FactorSource.from_db(args.db, history=not args.static_factors, backfill=args.backfill_factors)
+    symbols = sorted(factors.factors)
+
+    grid = dict(
+        quant_threshold=args.quant_threshold,
+        target_ratio=args.target_ratio,
+        rebalance_every=args.rebalance_every,
+        strategy=args.strategy,
+        max_positions=[m or None for m in args.max_positions],
+        position_cap=args.position_cap,
+    )
+    results = sweep(grid, args.bars, symbols, factors, bar_size=args.bar_size, workers=args.workers)
+
+    table = PrettyTable(["quant <", "target x", "rebal", "strategy", "max pos", "pos cap", "return %", "annual %", "max dd %", "turnover", "trades", "commission"], float_format=".2")
+    for r in sorted(results, key=lambda r: -r.annual_return):
+        c = r.config
+        table.add_row([c.quant_threshold, c.target_ratio, c.rebalance_every, c.strategy, c.max_positions or "-", c.position_cap, r.total_return * 100, r.annual_return * 100, r.max_drawdown * 100, r.turnover, r.trades, r.commission])
+    print(table)
+
+if __name__ == "__main__":
+    main()
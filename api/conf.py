@@ -1,20 +1,133 @@
-import logging, os, time, pathlib
+import atexit, copy, json, logging, logging.handlers, os, queue, threading, time, pathlib
 from pprint import pp
 
 class Config:
     VERSION = "0.0.1"
     ACCOUNT = "DU7002581"
     BASE_PATH = pathlib.Path(os.getcwd())
+    DB_URL = "sqlite:///stocks.sqlite3"
+    DB_WAL = False
+    DB_MEMORY = False               # work in memory, checkpoint to DB_URL (see api.db.Checkpointer)
+    DB_CHECKPOINT_INTERVAL = 60
+    MARKET_DATA_LINES = 100
+    BARS_PATH = BASE_PATH / "bars"
+    ALLOCATION = dict(
+        strategy="score",           # score, risk_parity, mean_variance; these only differ when
+                                    # max_positions * position_cap > 1 (or max_positions=None)
+        min_score=13,               # quant + author + analyst rating floor
+        position_cap=.2,
+        sector_cap=.4,              # full sectors are skipped when picking the top max_positions
+        turnover_penalty=0.0,
+        max_positions=5,
+    )
+    METRICS = True
+    METRICS_INTERVAL = 60
+    LOG_ASYNC = True                # handlers run on a listener thread, not the caller's
+    LOG_FORMAT = "text"             # text, json (one object per line)
+    LOG_MAX_BYTES = 50 * 2**20      # size-based rotation; 0 to disable
+    LOG_ROTATE_WHEN = None          # or time-based rotation, e.g. "midnight", "H"
+    LOG_BACKUPS = 10
+    LOG_RATE_LIMITS = dict(         # module -> DEBUG/INFO records per second; WARNING and up always pass
+        db=50,
+        wrappers=50,
+        history=20,
+    )
 
-def set_logger(file_level=logging.ERROR, console_level=logging.WARN):
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        out = dict(
+            ts=round(record.created, 3),
+            level=record.levelname,
+            thread=record.threadName,
+            src=f"{record.filename}:{record.lineno}",
+            msg=record.getMessage(),
+        )
+        if getattr(record, "suppressed", 0):
+            out["suppressed"] = record.suppressed
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            out["exc"] = record.exc_text
+        return json.dumps(out, default=str)
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """
+    The stock prepare() renders the traceback into msg and drops it, so the
+    listener's formatters can't tell message from exception. Merge the args
+    and keep the traceback as exc_text instead, which both formatters read.
+    """
+    _formatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = record.exc_text or self._formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token bucket per subsystem (record.module) for records below WARNING.
+    Dropped records are counted; the next record let through from that
+    subsystem carries the count as record.suppressed.
+    """
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.rates = rates
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(record.module)
+        if not rate or record.levelno >= logging.WARNING:
+            return True
+        with self._lock:
+            tokens, last, dropped = self._buckets.get(record.module, (rate, record.created, 0))
+            tokens = min(rate, tokens + (record.created - last) * rate)
+            if tokens < 1:
+                self._buckets[record.module] = (tokens, record.created, dropped + 1)
+                return False
+            self._buckets[record.module] = (tokens - 1, record.created, 0)
+        if dropped:
+            record.msg = f"{record.getMessage()} [{dropped} suppressed]"
+            record.args = None
+            record.suppressed = dropped
+        return True
+
+
+_listener: logging.handlers.QueueListener = None
+
+def set_logger(file_level=logging.ERROR, console_level=logging.WARN, asynchronous=None, fmt=None, path=None, rate_limits=None, name="tws"):
+    """
+    Attach file and console handlers to the tws-alpha logger. When asynchronous
+    (Config.LOG_ASYNC) the logger only gets a QueueHandler; formatting and I/O
+    happen on a listener thread, so reader-thread callbacks never block on disk
+    or the terminal. Records still queued at exit are flushed by atexit.
+    """
+    global _listener
+    asynchronous = Config.LOG_ASYNC if asynchronous is None else asynchronous
+    fmt = fmt or Config.LOG_FORMAT
+    rate_limits = Config.LOG_RATE_LIMITS if rate_limits is None else rate_limits
     os.makedirs("_logs", exist_ok=True)
+    # one file per process: rotating handlers must not share a file across processes
+    path = path or time.strftime(f"_logs/{name}.%Y%m%d_%H%M%S.{'log' if fmt == 'text' else 'jsonl'}")
 
     recfmt = '(%(threadName)s) %(asctime)s.%(msecs)03d %(levelname)s %(filename)s:%(lineno)d %(message)s'
     timefmt = '%y%m%d_%H:%M:%S'
 
     logger = logging.getLogger('tws-alpha')
     logger.setLevel(logging.DEBUG)
-    fh = logging.FileHandler(filename=time.strftime("_logs/tws.%Y%m%d_%H%M%S.log"))
+    reset_logger()
+
+    if Config.LOG_ROTATE_WHEN:
+        fh = logging.handlers.TimedRotatingFileHandler(path, when=Config.LOG_ROTATE_WHEN, backupCount=Config.LOG_BACKUPS)
+    elif Config.LOG_MAX_BYTES:
+        fh = logging.handlers.RotatingFileHandler(path, maxBytes=Config.LOG_MAX_BYTES, backupCount=Config.LOG_BACKUPS)
+    else:
+        fh = logging.FileHandler(filename=path)
     fh.setLevel(file_level)
 
     ch = logging.StreamHandler()
@@ -22,10 +135,34 @@ def set_logger(file_level=logging.ERROR, console_level=logging.WARN):
 
     fmtr = logging.Formatter(fmt=recfmt, datefmt=timefmt)
 
-    fh.setFormatter(fmtr)
+    fh.setFormatter(JsonFormatter() if fmt == "json" else fmtr)
     ch.setFormatter(fmtr)
 
-    logger.addHandler(fh)
-    logger.addHandler(ch)
+    if asynchronous:
+        qh = QueueHandler(queue.SimpleQueue())
+        # records below both handler levels never reach the queue
+        qh.setLevel(min(file_level, console_level))
+        _listener = logging.handlers.QueueListener(qh.queue, fh, ch, respect_handler_level=True)
+        _listener.start()
+        logger.addHandler(qh)
+    else:
+        logger.addHandler(fh)
+        logger.addHandler(ch)
+    logger.addFilter(RateLimitFilter(rate_limits))
 
     return logger
+
+def reset_logger():
+    """Stop the listener (flushing what's queued) and detach every handler."""
+    global _listener
+    if _listener:
+        _listener.stop()
+        _listener = None
+    logger = logging.getLogger('tws-alpha')
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+    for f in [f for f in logger.filters if isinstance(f, RateLimitFilter)]:
+        logger.removeFilter(f)
+
+atexit.register(reset_logger)
@@ -1,32 +1,192 @@
 
 import csv
 from decimal import Decimal
+import signal
+import sqlite3
+import threading
 import time
-from typing import List, Tuple
-from sqlalchemy import create_engine, select
+from typing import Dict, List, Tuple
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
 import logging
 from api.conf import Config
 from api.recommendations import sell_above_analyst_target, sell_bad_quants
 from api.wrappers import twsClient, twsWrapper
-from etl.yahoo_finance import get_analyst_target_mean
+from etl.yahoo_finance import get_analyst_target_mean, get_sector
 from ibapi.common import ListOfContractDescription, TagValueList, TickAttrib, TickerId
 from ibapi.contract import Contract, ContractDescription
 from ibapi.order import Order
 from ibapi.ticktype import TickType
-from api.models import Base, Account, Position
+from api.account_values import AccountValues
+from api.factors import FactorHistory
+from api.fixed import from_micro
+from api.migrations import migrate
+from api.models import Account, Position
 
 from ibapi.utils import iswrapper
 
 logger = logging.getLogger('tws-alpha')
 
+def enable_wal(engine):
+    """WAL journal so several processes can share the database: readers don't block the writer."""
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=30000")
+        cursor.close()
+
+class Checkpointer(threading.Thread):
+    """
+    Keeps an in-memory database and its file in step with SQLite's online
+    backup API: restore() copies the file into memory at startup, and
+    checkpoint() copies memory back to the file every interval seconds, on
+    stop() and on SIGTERM/SIGHUP.
+
+    Recovery: each backup copies the whole database in one step, so the file
+    is always a complete snapshot; after a crash it holds the state as of the
+    last checkpoint. Anything newer - prices, positions, account values - is
+    re-sent by TWS on the next connect, but watchlist loads and factor
+    snapshots made since then must be redone. A process killed with SIGKILL
+    (or a power loss) gets no final checkpoint.
+    """
+    def __init__(self, connection: sqlite3.Connection, path: str, interval: float = 60.0, lock: threading.RLock = None):
+        super().__init__(name="checkpoint", daemon=True)
+        self.connection = connection
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        # memory_engine's lock, so a backup waits for the transaction in progress
+        self._lock = lock or threading.RLock()
+
+    def restore(self):
+        disk = sqlite3.connect(self.path)
+        try:
+            disk.backup(self.connection)
+        finally:
+            disk.close()
+        logger.info(f"Loaded {self.path} into memory")
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.checkpoint()
+
+    def checkpoint(self):
+        with self._lock:
+            if self.connection.in_transaction:
+                # a signal handler interrupting this thread's own transaction
+                logger.warning(f"Skipped checkpoint to {self.path}: transaction in progress")
+                return False
+            try:
+                disk = sqlite3.connect(self.path)
+                try:
+                    self.connection.backup(disk)
+                finally:
+                    disk.close()
+            except sqlite3.Error as e:
+                logger.error(f"Checkpoint to {self.path} failed: {e}")
+                return False
+        logger.debug(f"Checkpointed to {self.path}")
+        return True
+
+    def install_signal_handlers(self):
+        if threading.current_thread() is not threading.main_thread():
+            return
+        for signum in (signal.SIGTERM, getattr(signal, "SIGHUP", None)):
+            if signum is None:
+                continue
+            previous = signal.getsignal(signum)
+
+            def handler(signum, frame, previous=previous):
+                self.checkpoint()
+                if callable(previous):
+                    previous(signum, frame)
+                elif previous != signal.SIG_IGN:
+                    raise SystemExit(128 + signum)
+            signal.signal(signum, handler)
+
+    def stop(self):
+        self.stopped.set()
+        self.checkpoint()
+
+class _SerializedConnection:
+    """
+    The shared in-memory connection as SQLAlchemy sees it: a transaction takes
+    the lock when it begins and gives it back once the DBAPI commit or
+    rollback has run. Counted per thread, so sessions nested on one thread
+    re-enter and the pool's rollback on return (no transaction) is a no-op.
+    """
+    def __init__(self, connection: sqlite3.Connection, lock: threading.RLock):
+        self._connection = connection
+        self._lock = lock
+        self._local = threading.local()
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def begin(self, conn=None):
+        self._lock.acquire()
+        self._local.depth = getattr(self._local, "depth", 0) + 1
+
+    def commit(self):
+        self._end(self._connection.commit)
+
+    def rollback(self):
+        self._end(self._connection.rollback)
+
+    def _end(self, fn):
+        try:
+            fn()
+        finally:
+            if getattr(self._local, "depth", 0):
+                self._local.depth -= 1
+                self._lock.release()
+
+def memory_engine():
+    """
+    Engine over a single in-memory connection (StaticPool), plus that
+    connection and a lock for backups. Every thread shares the connection, so
+    transactions run one at a time under the lock, and a checkpoint taken
+    under it only copies committed state. A thread that keeps a transaction
+    open across slow calls holds the others up meanwhile. Commits cost no
+    fsync in memory.
+    """
+    connection = sqlite3.connect(":memory:", check_same_thread=False)
+    lock = threading.RLock()
+    serialized = _SerializedConnection(connection, lock)
+    engine = create_engine("sqlite://", poolclass=StaticPool, creator=lambda: serialized)
+    event.listen(engine, "begin", serialized.begin)
+    return engine, connection, lock
+
 class twsDatabase(twsWrapper, twsClient):
-    def __init__(self, fresh=False, **kwargs) -> None:
-        self.engine = create_engine("sqlite:///stocks.sqlite3")
+    def __init__(self, fresh=False, db_url=Config.DB_URL, wal=Config.DB_WAL, memory=Config.DB_MEMORY, **kwargs) -> None:
+        self.checkpointer: Checkpointer = None
+        if memory:
+            self.engine, connection, lock = memory_engine()
+            self.checkpointer = Checkpointer(connection, make_url(db_url).database, Config.DB_CHECKPOINT_INTERVAL, lock)
+            self.checkpointer.restore()
+        else:
+            self.engine = create_engine(db_url)
+            if wal:
+                enable_wal(self.engine)
+        self.req_symbols: Dict[int, str] = {}
+
+        migrate(self.engine, fresh=fresh)
+        self.factors = FactorHistory(self.engine)
+        self.account_values = AccountValues(self.engine)
+
+        if self.checkpointer:
+            self.checkpointer.start()
+            self.checkpointer.install_signal_handlers()
 
-        if fresh:
-            Base.metadata.drop_all(self.engine)
-            Base.metadata.create_all(self.engine)
+    def stop(self):
+        self.account_values.flush()
+        if self.checkpointer:
+            self.checkpointer.stop()
+        super().stop()
 
     def error(self, reqId: TickerId, errorCode: int, errorString: str, advancedOrderRejectJson=""):
         super().error(reqId, errorCode, errorString, advancedOrderRejectJson)
@@ -34,6 +194,7 @@ class twsDatabase(twsWrapper, twsClient):
     
     def refresh_all(self):
         with Session(self.engine) as session:
+            refreshed: List[Position] = []
             for obj in session.query(Position).filter(Position.req_id == None):
                 logger.info(f"Getting data for {obj.symbol}")
                 contract=Contract()
@@ -43,8 +204,17 @@ class twsDatabase(twsWrapper, twsClient):
                 contract.currency = obj.currency
                 self.reqMktData(self.nextOrderId(), contract, "", False, False, [])
                 obj.analyst_target = get_analyst_target_mean(obj.symbol)
+                if obj.sector is None:
+                    obj.sector = get_sector(obj.symbol)
                 session.add(obj)
+                refreshed.append(obj)
+            changed = self.factors.record(session, refreshed)
             session.commit()
+        self.factors_changed(changed)
+
+    def factors_changed(self, symbols: List[str]):
+        """Called after ratings or analyst targets change for symbols."""
+        pass
 
     def clear_watchlist(self):
         with Session(self.engine) as session:
@@ -69,42 +239,31 @@ class twsDatabase(twsWrapper, twsClient):
                     logger.info(f"DES,{obj.symbol},{obj.sec_type},SMART/AMEX,,,,,,{obj.target_liquidity * 100}")
             logger.info(f"Rebalance exported...{objs.count()} positions changed")
 
+    def sell_order(self, obj: Position, lmtPrice: float) -> Tuple[Order, Contract]:
+        contract = Contract()
+        contract.symbol = obj.symbol
+        contract.secType = obj.sec_type
+
+        order = Order()
+        order.account = obj.account_id
+        order.action = "SELL"
+        order.totalQuantity = from_micro(obj._position)
+        order.orderType = "LMT"
+        order.lmtPrice = lmtPrice
+        order.tif = "GTC"
+        order.transmit = True
+        return order, contract
+
     def generate_sell_recs(self):
         sells: List[Tuple[Order, Contract]] = []
 
         with Session(self.engine) as session:
             objs = session.query(Position).where(Position._position > 0).all()
             for obj in sell_bad_quants(objs):
-                contract = Contract()
-                contract.symbol = obj.symbol
-                contract.secType = obj.sec_type
-                # contract.position = obj
-                
-                order = Order()
-                order.account = obj.account_id
-                order.action = "SELL"
-                order.totalQuantity = obj._position
-                order.orderType = "LMT"
-                order.lmtPrice = obj.last_trade
-                order.tif = "GTC"
-                order.transmit = True
-                sells.append((order, contract))
+                sells.append(self.sell_order(obj, obj.last_trade))
 
             for obj in sell_above_analyst_target(objs):
-                contract = Contract()
-                contract.symbol = obj.symbol
-                contract.secType = obj.sec_type
-                # contract.position = obj
-
-                order = Order()
-                order.account = obj.account_id
-                order.action = "SELL"
-                order.totalQuantity = obj._position
-                order.orderType = "LMT"
-                order.lmtPrice = obj.analyst_target
-                order.tif = "GTC"
-                order.transmit = True
-                sells.append((order, contract))
+                sells.append(self.sell_order(obj, obj.analyst_target))
         return sells
     
     def generate_buy_recs(self):
@@ -116,6 +275,7 @@ class twsDatabase(twsWrapper, twsClient):
         return buys
 
     def stop_request(self, reqId: TickerId):
+        self.req_symbols.pop(reqId, None)
         with Session(self.engine) as session:
             for obj in session.scalars(select(Position).where(Position.req_id == reqId)):
                 self.cancelMktData(reqId)
@@ -124,6 +284,7 @@ class twsDatabase(twsWrapper, twsClient):
             session.commit()
 
     def cancel_all(self):
+        self.req_symbols.clear()
         with Session(self.engine) as session:
             for obj in session.scalars(select(Position)):
                 obj.req_id = None
@@ -140,8 +301,11 @@ class twsDatabase(twsWrapper, twsClient):
     def add_position(self, position: Position):
         symbol = position.symbol
         with Session(self.engine) as session:
-            session.add(session.merge(position))
+            merged = session.merge(position)
+            session.add(merged)
+            changed = self.factors.record(session, [merged])
             session.commit()
+        self.factors_changed(changed)
         
         self.reqMatchingSymbols(self.nextOrderId(), symbol)
 
@@ -152,20 +316,31 @@ class twsDatabase(twsWrapper, twsClient):
 
     @iswrapper
     def updateAccountValue(self, key: str, val: str, currency: str, accountName: str):
-        """Database update for account value"""
-        with Session(self.engine) as session:
-            match key:
-                case "CashBalance":
-                    obj = session.get(Account, accountName)
-                    if not obj:
-                        obj = Account(id=accountName)
-                    obj.cash_balance = Decimal(val)
-                    obj.updated_at = int(time.time())
-                    logger.debug(f"Updated Cash Balance: {obj.id}, {obj.cash_balance}")
-                    session.add(obj)
-            session.commit()
+        """Database update for account value; unchanged values are dropped here"""
+        if not self.account_values.update(accountName, key, val, currency):
+            return
+        if key == "CashBalance" and currency == "USD":
+            with Session(self.engine) as session:
+                obj = session.get(Account, accountName)
+                if not obj:
+                    obj = Account(id=accountName)
+                obj.cash_balance = Decimal(val)
+                obj.updated_at = int(time.time())
+                logger.debug(f"Updated Cash Balance: {obj.id}, {obj.cash_balance}")
+                session.add(obj)
+                session.commit()
         super().updateAccountValue(key, val, currency, accountName)
 
+    @iswrapper
+    def updateAccountTime(self, timeStamp: str):
+        self.account_values.flush()
+        super().updateAccountTime(timeStamp)
+
+    @iswrapper
+    def accountDownloadEnd(self, accountName: str):
+        self.account_values.flush()
+        super().accountDownloadEnd(accountName)
+
     @iswrapper
     def managedAccounts(self, accountsList: str):
         with Session(self.engine) as session:
@@ -247,6 +422,7 @@ class twsDatabase(twsWrapper, twsClient):
             obj = session.get(Position, contract.symbol)
             if obj:
                 obj.req_id = reqId
+                self.req_symbols[reqId] = obj.symbol
                 logger.debug(f"Requesting Market Data Stream for {obj.symbol} ReqId {reqId}")
                 session.add(obj)
                 session.commit()
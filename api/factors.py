@@ -0,0 +1,98 @@
+import bisect
+import struct
+import time
+from typing import Dict, Iterable, List, Tuple
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from api.models import FACTOR_FIELDS, FactorSnapshot, Position
+import logging
+
+logger = logging.getLogger('tws-alpha')
+
+# ratings and grades as float32, analyst_target as float64: 40 bytes per row
+FACTORS = struct.Struct("<8fd")
+
+def pack(obj) -> bytes:
+    return FACTORS.pack(*(float(getattr(obj, f) or 0) for f in FACTOR_FIELDS))
+
+def unpack(blob: bytes) -> Dict[str, float]:
+    return dict(zip(FACTOR_FIELDS, FACTORS.unpack(blob)))
+
+
+class FactorHistory:
+    """
+    Append-only factor snapshots. record() compares each position's packed
+    factors with the latest stored for that symbol (cached in memory) and writes
+    a row only when they differ.
+    """
+    def __init__(self, engine):
+        self.engine = engine
+        self._latest: Dict[str, Tuple[int, bytes]] = None
+
+    def _load_latest(self, session: Session):
+        newest = (select(FactorSnapshot.symbol, func.max(FactorSnapshot.ts).label("ts"))
+            .group_by(FactorSnapshot.symbol).subquery())
+        rows = session.execute(select(FactorSnapshot.symbol, FactorSnapshot.ts, FactorSnapshot.factors)
+            .join(newest, (FactorSnapshot.symbol == newest.c.symbol) & (FactorSnapshot.ts == newest.c.ts)))
+        self._latest = {symbol: (ts, blob) for symbol, ts, blob in rows}
+
+    def record(self, session: Session, positions: Iterable[Position], ts: int = None) -> List[str]:
+        """Stage snapshots for changed positions in session; the caller commits. Returns the changed symbols."""
+        if self._latest is None:
+            self._load_latest(session)
+        ts = ts or int(time.time())
+        changed: List[str] = []
+        for obj in positions:
+            blob = pack(obj)
+            latest = self._latest.get(obj.symbol)
+            if latest and latest[1] == blob:
+                continue
+            if latest and latest[0] >= ts:
+                # second change within the same second replaces the first
+                session.merge(FactorSnapshot(symbol=obj.symbol, ts=latest[0], factors=blob))
+                self._latest[obj.symbol] = (latest[0], blob)
+            else:
+                session.add(FactorSnapshot(symbol=obj.symbol, ts=ts, factors=blob))
+                self._latest[obj.symbol] = (ts, blob)
+            changed.append(obj.symbol)
+        if changed:
+            logger.debug(f"Recorded {len(changed)} factor snapshots")
+        return changed
+
+    def as_of(self, ts: int, symbols: List[str] = None) -> Dict[str, Dict[str, float]]:
+        """Factors in effect at ts for every symbol (or the given ones) that had any by then."""
+        with Session(self.engine) as session:
+            newest = select(FactorSnapshot.symbol, func.max(FactorSnapshot.ts).label("ts")).where(FactorSnapshot.ts <= ts)
+            if symbols is not None:
+                newest = newest.where(FactorSnapshot.symbol.in_(symbols))
+            newest = newest.group_by(FactorSnapshot.symbol).subquery()
+            rows = session.execute(select(FactorSnapshot.symbol, FactorSnapshot.factors)
+                .join(newest, (FactorSnapshot.symbol == newest.c.symbol) & (FactorSnapshot.ts == newest.c.ts)))
+            return {symbol: unpack(blob) for symbol, blob in rows}
+
+    def changed_since(self, ts: int) -> List[str]:
+        """Symbols with a snapshot newer than ts."""
+        with Session(self.engine) as session:
+            return list(session.scalars(select(FactorSnapshot.symbol).where(FactorSnapshot.ts > ts).distinct()))
+
+    def timeline(self) -> Dict[str, Tuple[List[int], List[Dict[str, float]]]]:
+        """Every snapshot, per symbol, in ts order."""
+        out: Dict[str, Tuple[List[int], List[Dict[str, float]]]] = {}
+        with Session(self.engine) as session:
+            for symbol, ts, blob in session.execute(select(FactorSnapshot.symbol, FactorSnapshot.ts, FactorSnapshot.factors).order_by(FactorSnapshot.symbol, FactorSnapshot.ts)):
+                times, values = out.setdefault(symbol, ([], []))
+                times.append(ts)
+                values.append(unpack(blob))
+        return out
+
+
+def as_of_timeline(timeline: Dict[str, Tuple[List[int], List[Dict[str, float]]]], ts: int, backfill: bool = False) -> Dict[str, Dict[str, float]]:
+    """as_of over a preloaded timeline: one bisect per symbol. With backfill, ts before a symbol's first snapshot gets that snapshot."""
+    out = {}
+    for symbol, (times, values) in timeline.items():
+        i = bisect.bisect_right(times, ts)
+        if i:
+            out[symbol] = values[i - 1]
+        elif backfill and values:
+            out[symbol] = values[0]
+    return out
@@ -0,0 +1,61 @@
+from decimal import ROUND_HALF_EVEN, Decimal
+from typing import Sequence
+import numpy as np
+
+# quantities, cash and weights are stored as integer micro-units (SQLite INTEGER)
+SCALE = 6
+MICRO = 10 ** SCALE
+
+def to_micro(val) -> int:
+    """Exact for int/Decimal/str; floats round to the nearest micro-unit, so 0.1 -> 100000."""
+    if val is None:
+        return 0
+    if isinstance(val, int):
+        return val * MICRO
+    if isinstance(val, float):
+        # below 1e9 a double has enough digits that this matches rounding its repr
+        if abs(val) < 1e9:
+            return round(val * MICRO)
+        val = repr(val)
+    return int(Decimal(val).scaleb(SCALE).to_integral_value(ROUND_HALF_EVEN))
+
+def from_micro(units: int, places: int = SCALE) -> Decimal:
+    """Decimal with exactly `places` digits after the point, rounded half-even."""
+    if units is None:
+        units = 0
+    if places < SCALE:
+        units = round(units, places - SCALE) // 10 ** (SCALE - places)
+    else:
+        places = SCALE
+    return Decimal(units).scaleb(-places)
+
+def to_float(units) -> np.ndarray | float:
+    if isinstance(units, int):
+        return units / MICRO
+    return np.asarray(units, dtype=np.int64) / MICRO
+
+def order_price(price: float) -> float:
+    """
+    Limit price rounded to the minimum tick (a cent from $1, 1/100 cent below),
+    so the float sent to IB is the nearest to an exact tick.
+    """
+    if price is None:
+        raise ValueError("No limit price")
+    return float(from_micro(to_micro(price), 2 if abs(price) >= 1 else 4))
+
+def liquidity_micro(position: int, price: float, cash: int) -> int:
+    """position * price / cash in micro-units, integer arithmetic after converting price once."""
+    if position <= 0 or not price or not cash:
+        return 0
+    # floor(x + 1/2) of position * price / cash, for either sign of cash
+    num, den = position * to_micro(price), cash
+    return (2 * num + den) // (2 * den)
+
+def liquidity(positions: Sequence[int], prices: Sequence[float], cash: Sequence[int] | int) -> np.ndarray:
+    """Vectorized liquidity for many rows: (micro positions, prices, micro cash) -> float weights."""
+    q = np.asarray(positions, dtype=np.int64)
+    p = np.nan_to_num(np.asarray(prices, dtype=np.float64))
+    c = np.asarray(cash, dtype=np.int64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = q * p / c
+    return np.where((q > 0) & (c != 0) & np.isfinite(out), out, 0.0)
@@ -0,0 +1,216 @@
+import datetime
+import math
+import os
+import pathlib
+import threading
+import time
+from typing import Dict, List, Tuple
+import numpy as np
+from sqlalchemy.orm import Session
+from api.conf import Config
+from api.models import Position
+from ibapi.common import BarData, TickerId
+from ibapi.contract import Contract
+from ibapi.utils import iswrapper
+import logging
+
+logger = logging.getLogger('tws-alpha')
+
+BAR_DTYPE = np.dtype([
+    ("ts", "<i8"),
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("volume", "<f8"),
+])
+
+BAR_SECONDS = {
+    "1 min": 60,
+    "5 mins": 300,
+    "15 mins": 900,
+    "30 mins": 1800,
+    "1 hour": 3600,
+    "1 day": 86400,
+    "1 week": 604800,
+}
+
+class BarStore:
+    """
+    Append-only OHLCV store: one flat file of BAR_DTYPE records per symbol and
+    bar size, sorted by bar start time (epoch seconds). Reads are memory-mapped,
+    so a range read is two binary searches and a slice.
+
+        bars/<bar size>/<symbol>.bars
+    """
+    def __init__(self, root: pathlib.Path = None):
+        self.root = pathlib.Path(root or Config.BARS_PATH)
+
+    def path(self, symbol: str, bar_size: str) -> pathlib.Path:
+        return self.root / bar_size.replace(" ", "") / f"{symbol}.bars"
+
+    def symbols(self, bar_size: str) -> List[str]:
+        folder = self.root / bar_size.replace(" ", "")
+        if not folder.exists():
+            return []
+        return sorted(p.stem for p in folder.glob("*.bars"))
+
+    def read(self, symbol: str, bar_size: str, start: int = None, end: int = None) -> np.ndarray:
+        """Bars with start <= ts < end, as a read-only view over the file."""
+        path = self.path(symbol, bar_size)
+        count = path.stat().st_size // BAR_DTYPE.itemsize if path.exists() else 0
+        if not count:
+            return np.empty(0, dtype=BAR_DTYPE)
+
+        bars = np.memmap(path, dtype=BAR_DTYPE, mode="r", shape=(count,))
+        lo = 0 if start is None else np.searchsorted(bars["ts"], start, side="left")
+        hi = len(bars) if end is None else np.searchsorted(bars["ts"], end, side="left")
+        return bars[lo:hi]
+
+    def last_ts(self, symbol: str, bar_size: str) -> int | None:
+        path = self.path(symbol, bar_size)
+        size = path.stat().st_size if path.exists() else 0
+        if size < BAR_DTYPE.itemsize:
+            return None
+        with open(path, "rb") as f:
+            f.seek(size - size % BAR_DTYPE.itemsize - BAR_DTYPE.itemsize)
+            return int(np.frombuffer(f.read(BAR_DTYPE.itemsize), dtype=BAR_DTYPE)["ts"][0])
+
+    def append(self, symbol: str, bar_size: str, bars: np.ndarray) -> int:
+        """Append bars newer than anything stored. Returns the number written."""
+        if not len(bars):
+            return 0
+        bars = np.sort(np.asarray(bars, dtype=BAR_DTYPE), order="ts")
+        last = self.last_ts(symbol, bar_size)
+        if last is not None:
+            bars = bars[bars["ts"] > last]
+        if not len(bars):
+            return 0
+
+        path = self.path(symbol, bar_size)
+        os.makedirs(path.parent, exist_ok=True)
+        with open(path, "ab") as f:
+            f.write(bars.tobytes())
+        return len(bars)
+
+
+def synthetic_bars(count: int, start: int = 1_600_000_000, step: int = 86400, price: float = 100.0, volatility: float = .02, seed: int = 0) -> np.ndarray:
+    """Geometric random walk OHLCV bars, for exercising the store and analytics offline."""
+    rng = np.random.default_rng(seed)
+    closes = price * np.exp(np.cumsum(rng.normal(0, volatility, count)))
+    opens = np.concatenate(([price], closes[:-1]))
+    spread = np.abs(rng.normal(0, volatility / 2, count)) * closes
+
+    bars = np.empty(count, dtype=BAR_DTYPE)
+    bars["ts"] = start + step * np.arange(count, dtype=np.int64)
+    bars["open"] = opens
+    bars["close"] = closes
+    bars["high"] = np.maximum(opens, closes) + spread
+    bars["low"] = np.minimum(opens, closes) - spread
+    bars["volume"] = rng.integers(1_000, 1_000_000, count)
+    return bars
+
+def parse_bar_date(date: str) -> int:
+    """IB bar date with formatDate=2: epoch seconds intraday, YYYYMMDD for daily and up."""
+    date = date.strip()
+    if len(date) == 8 and date.isdigit():
+        return int(datetime.datetime.strptime(date, "%Y%m%d").replace(tzinfo=datetime.timezone.utc).timestamp())
+    return int(date.split()[0])
+
+def duration_since(last_ts: int | None, default: str = "1 Y", now: float = None) -> str:
+    """Smallest IB durationStr that reaches back to last_ts."""
+    if last_ts is None:
+        return default
+    days = math.ceil(((now or time.time()) - last_ts) / 86400) + 1
+    if days > 365:
+        return f"{math.ceil(days / 365)} Y"
+    return f"{days} D"
+
+
+class twsHistory:
+    """
+    Historical bar ingestion. Mix in ahead of twsDatabase; requests go through
+    twsClient.reqHistoricalData and so share its pacing limiter.
+    """
+    def __init__(self, bars: BarStore = None):
+        self.bars = bars or BarStore()
+        self._pending_bars: Dict[int, Tuple[str, str, List[tuple]]] = {}
+        self._backfill_thread: threading.Thread = None
+
+    def backfill(self, symbol: str, bar_size: str = "1 day", duration: str = "1 Y"):
+        """Request everything after the last stored bar, or duration if there is none."""
+        with Session(self.engine) as session:
+            obj = session.get(Position, symbol)
+            if not obj:
+                logger.warning(f"Can't backfill {symbol}, not in database")
+                return
+
+            contract = Contract()
+            contract.symbol = obj.symbol
+            contract.secType = obj.sec_type or "STK"
+            contract.currency = obj.currency or "USD"
+            contract.exchange = "SMART"
+            contract.primaryExchange = obj.primary_exchange
+
+        reqId = self.nextOrderId()
+        self._pending_bars[reqId] = (symbol, bar_size, [])
+        durationStr = duration_since(self.bars.last_ts(symbol, bar_size), default=duration)
+        logger.info(f"Requesting {durationStr} of {bar_size} bars for {symbol} ReqId {reqId}")
+        self.reqHistoricalData(reqId, contract, "", durationStr, bar_size, "TRADES", 1, 2, False, [])
+
+    def backfill_all(self, bar_size: str = "1 day", duration: str = "1 Y") -> threading.Thread | None:
+        """
+        Backfill every symbol from a background thread, which is the one that
+        waits on the pacing limiter; the run loop keeps serving the menu.
+        """
+        if self._backfill_thread is not None and self._backfill_thread.is_alive():
+            logger.warning("Backfill already running")
+            return None
+        with Session(self.engine) as session:
+            symbols = [obj.symbol for obj in session.query(Position).filter(Position.sec_type != None)]
+
+        def run():
+            for symbol in symbols:
+                if not self.isConnected():
+                    return
+                try:
+                    self.backfill(symbol, bar_size, duration)
+                except Exception as e:
+                    logger.error(f"Backfill of {symbol} failed: {e}")
+            logger.info(f"Requested bars for {len(symbols)} symbols")
+
+        self._backfill_thread = threading.Thread(target=run, name="backfill", daemon=True)
+        self._backfill_thread.start()
+        return self._backfill_thread
+
+    def error(self, reqId: TickerId, errorCode: int, errorString: str, advancedOrderRejectJson=""):
+        pending = self._pending_bars.pop(reqId, None)
+        if pending:
+            logger.warning(f"Historical data for {pending[0]} failed: {errorCode} {errorString}")
+        super().error(reqId, errorCode, errorString, advancedOrderRejectJson)
+
+    @iswrapper
+    def historicalData(self, reqId: int, bar: BarData):
+        pending = self._pending_bars.get(reqId)
+        if pending:
+            pending[2].append((parse_bar_date(bar.date), bar.open, bar.high, bar.low, bar.close, float(bar.volume)))
+        super().historicalData(reqId, bar)
+
+    @iswrapper
+    def historicalDataEnd(self, reqId: int, start: str, end: str):
+        pending = self._pending_bars.pop(reqId, None)
+        if pending:
+            symbol, bar_size, rows = pending
+            bars = np.array(rows, dtype=BAR_DTYPE)
+            # the newest bar is still forming until its period has elapsed
+            bars = bars[bars["ts"] + BAR_SECONDS.get(bar_size, 0) <= time.time()]
+            last = self.bars.last_ts(symbol, bar_size)
+            written = self.bars.append(symbol, bar_size, bars)
+            logger.info(f"Stored {written} {bar_size} bars for {symbol}")
+            if written:
+                self.bars_stored(symbol, bar_size, bars if last is None else bars[bars["ts"] > last])
+        super().historicalDataEnd(reqId, start, end)
+
+    def bars_stored(self, symbol: str, bar_size: str, bars: np.ndarray):
+        """Called with the bars a backfill actually appended to the store."""
+        pass
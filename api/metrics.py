@@ -0,0 +1,251 @@
+import functools
+import json
+import threading
+import time
+from typing import Callable, Dict
+from prettytable import PrettyTable
+from ratelimit import RateLimitException
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from ibapi.client import EClient
+from ibapi.wrapper import EWrapper
+import logging
+
+logger = logging.getLogger('tws-alpha')
+
+REQUEST_PREFIXES = ("req", "cancel", "place", "calculate", "exercise")
+
+class Histogram:
+    """
+    HDR-style log-linear histogram of non-negative integers (nanoseconds here).
+
+    Values below 2**sub_bits are counted exactly; above that each power-of-two
+    range is split into 2**sub_bits buckets, so any recorded value is known to
+    within 1/2**sub_bits. Recording is a handful of integer ops and one list
+    increment; concurrent writers may race on a bucket, which costs at most a
+    lost sample.
+    """
+    def __init__(self, sub_bits: int = 4):
+        self.sub_bits = sub_bits
+        self.sub_count = 1 << sub_bits
+        self.counts = [0] * (self.sub_count * 65)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def _index(self, value: int) -> int:
+        if value < self.sub_count:
+            return value
+        shift = value.bit_length() - self.sub_bits - 1
+        return self.sub_count * (shift + 1) + (value >> shift) - self.sub_count
+
+    def _bucket_value(self, idx: int) -> int:
+        if idx < self.sub_count:
+            return idx
+        shift = idx // self.sub_count - 1
+        top = self.sub_count + idx % self.sub_count
+        return ((top << shift) + ((top + 1) << shift) - 1) // 2
+
+    def record(self, value: int):
+        value = int(value) if value > 0 else 0
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        if self.min is None or value < self.min:
+            self.min = value
+
+    def percentile(self, pct: float) -> int:
+        if not self.count:
+            return 0
+        rank = max(1, int(round(pct / 100 * self.count)))
+        seen = 0
+        for idx, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(self._bucket_value(idx), self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        return dict(
+            count=self.count,
+            mean=self.total / self.count if self.count else 0,
+            min=self.min or 0,
+            p50=self.percentile(50),
+            p90=self.percentile(90),
+            p99=self.percentile(99),
+            max=self.max,
+        )
+
+
+class Registry:
+    def __init__(self):
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, int] = {}
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str) -> Histogram:
+        hist = self.histograms.get(name)
+        if hist is None:
+            with self._lock:
+                hist = self.histograms.setdefault(name, Histogram())
+        return hist
+
+    def incr(self, name: str, n: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def snapshot(self) -> dict:
+        return dict(
+            ts=time.time(),
+            uptime=time.time() - self.started_at,
+            counters=dict(self.counters),
+            histograms={name: hist.summary() for name, hist in list(self.histograms.items()) if hist.count},
+        )
+
+    def dump(self, path):
+        with open(path, "a") as f:
+            f.write(json.dumps(self.snapshot()) + "\n")
+
+    def table(self) -> PrettyTable:
+        """Latency histograms in microseconds; queue depth in messages."""
+        table = PrettyTable(["metric", "count", "mean", "p50", "p99", "max"], float_format=".1")
+        table.align["metric"] = "l"
+        for name, hist in sorted(self.histograms.items()):
+            if not hist.count:
+                continue
+            scale = 1 if name.startswith("queue.") else 1e3
+            s = hist.summary()
+            table.add_row([name, s["count"], s["mean"] / scale, s["p50"] / scale, s["p99"] / scale, s["max"] / scale])
+        return table
+
+    def reset(self):
+        """Zero everything in place; wrappers keep references to their histograms."""
+        with self._lock:
+            for hist in self.histograms.values():
+                hist.__init__(hist.sub_bits)
+            self.counters.clear()
+            self.started_at = time.time()
+
+
+registry = Registry()
+
+def timed(name: str):
+    """Decorator recording call latency into registry.histogram(name)."""
+    def decorator(fn: Callable):
+        hist = registry.histogram(name)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter_ns()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                hist.record(time.perf_counter_ns() - t0)
+        return wrapper
+    return decorator
+
+def sleep_and_retry(func: Callable):
+    """ratelimit.sleep_and_retry, recording time spent blocked under ratelimit.<name>."""
+    hist = registry.histogram(f"ratelimit.{func.__name__}")
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        blocked = 0
+        while True:
+            try:
+                result = func(*args, **kwargs)
+                hist.record(blocked)
+                return result
+            except RateLimitException as exception:
+                t0 = time.perf_counter_ns()
+                time.sleep(exception.period_remaining)
+                blocked += time.perf_counter_ns() - t0
+    return wrapper
+
+def instrument(app):
+    """
+    Wrap every EWrapper callback and outbound EClient request on this instance.
+
+    Callbacks also sample the depth of the ibapi message queue. The decoder looks
+    callbacks up with getattr on the wrapper, so instance attributes are enough.
+    """
+    callbacks = [name for name, fn in vars(EWrapper).items() if callable(fn) and not name.startswith("_") and name != "logAnswer"]
+    requests = [name for name, fn in vars(EClient).items() if callable(fn) and name.startswith(REQUEST_PREFIXES)]
+
+    for name in callbacks:
+        setattr(app, name, _wrap_callback(app, name, getattr(app, name)))
+    for name in requests:
+        setattr(app, name, timed(f"request.{name}")(getattr(app, name)))
+
+def _wrap_callback(app, name: str, fn: Callable):
+    hist = registry.histogram(f"callback.{name}")
+    depth = registry.histogram("queue.depth")
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        queue = getattr(app, "msg_queue", None)
+        if queue is not None:
+            depth.record(queue.qsize())
+        t0 = time.perf_counter_ns()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            hist.record(time.perf_counter_ns() - t0)
+    return wrapper
+
+def instrument_engine(engine):
+    """Statement time per execute and wall time per Session transaction."""
+    execute = registry.histogram("db.execute")
+    session = registry.histogram("db.session")
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_t0", []).append(time.perf_counter_ns())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_execute(conn, cursor, statement, parameters, context, executemany):
+        execute.record(time.perf_counter_ns() - conn.info["metrics_t0"].pop())
+        registry.incr("db.statements")
+
+    @event.listens_for(engine, "commit")
+    def commit(conn):
+        registry.incr("db.commits")
+
+    if not getattr(Session, "_metrics_listening", False):
+        Session._metrics_listening = True
+
+        @event.listens_for(Session, "after_transaction_create")
+        def begin(sess, transaction):
+            if transaction.parent is None:
+                sess.info["metrics_t0"] = time.perf_counter_ns()
+
+        @event.listens_for(Session, "after_transaction_end")
+        def end(sess, transaction):
+            if transaction.parent is None and "metrics_t0" in sess.info:
+                session.record(time.perf_counter_ns() - sess.info.pop("metrics_t0"))
+
+
+class MetricsDumper(threading.Thread):
+    """Appends a registry snapshot to path every interval seconds."""
+    def __init__(self, path, interval: float = 60.0):
+        super().__init__(name="metrics", daemon=True)
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        try:
+            registry.dump(self.path)
+        except OSError as e:
+            logger.error(f"Could not write metrics to {self.path}: {e}")
+
+    def stop(self):
+        self.stopped.set()
+        self.flush()
@@ -0,0 +1,46 @@
+from typing import Callable, List, Tuple
+from sqlalchemy import inspect
+from sqlalchemy.engine import Connection, Engine
+from api.fixed import MICRO
+from api.models import Base
+import logging
+
+logger = logging.getLogger('tws-alpha')
+
+def _add_position_sector(conn: Connection):
+    conn.exec_driver_sql("ALTER TABLE position ADD COLUMN sector VARCHAR")
+
+def _fixed_point_quantities(conn: Connection):
+    # NUMERIC columns held floats; integer micro-units keep the same affinity
+    conn.exec_driver_sql(f"UPDATE position SET _position = CAST(ROUND(COALESCE(_position, 0) * {MICRO}) AS INTEGER), "
+                         f"_target_liquidity = CAST(ROUND(COALESCE(_target_liquidity, 0) * {MICRO}) AS INTEGER)")
+    conn.exec_driver_sql(f"UPDATE account SET _cash_balance = CAST(ROUND(_cash_balance * {MICRO}) AS INTEGER) "
+                         "WHERE _cash_balance IS NOT NULL")
+
+# (version, step); PRAGMA user_version records the last one applied
+MIGRATIONS: List[Tuple[int, Callable[[Connection], None]]] = [
+    (1, _add_position_sector),
+    (2, _fixed_point_quantities),
+]
+
+LATEST = MIGRATIONS[-1][0]
+
+def migrate(engine: Engine, fresh: bool = False):
+    """
+    Bring the schema up to date. New tables come from create_all; changes to
+    existing tables go through MIGRATIONS. A database created here starts at LATEST.
+    """
+    if fresh:
+        Base.metadata.drop_all(engine)
+    existing = inspect(engine).has_table("position")
+    Base.metadata.create_all(engine)
+
+    with engine.begin() as conn:
+        version = conn.exec_driver_sql("PRAGMA user_version").scalar()
+        if not existing:
+            version = LATEST
+        for step_version, step in MIGRATIONS:
+            if step_version > version:
+                logger.warning(f"Migrating database to version {step_version}: {step.__name__}")
+                step(conn)
+        conn.exec_driver_sql(f"PRAGMA user_version = {max(version, LATEST)}")
@@ -1,10 +1,11 @@
 from decimal import Decimal
 from typing import Set
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, Index
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 import time
 
 from ibapi.contract import Contract
+from api.fixed import from_micro, liquidity_micro, to_micro
 
 
 class Base(DeclarativeBase):
@@ -15,17 +16,17 @@ class Account(Base):
 
     id: Mapped[str] = mapped_column(primary_key=True)
     positions: Mapped[Set["Position"]] = relationship(back_populates="account")
-    _cash_balance: Mapped[Decimal] = mapped_column(nullable=True, default=None)
+    _cash_balance: Mapped[int] = mapped_column(nullable=True, default=None)  # micro-units
     created_at: Mapped[int] = mapped_column(default=int(time.time()))
     updated_at: Mapped[int] = mapped_column(default=int(time.time()))
 
     @property
-    def cash_balance(self):
-        return self._cash_balance.quantize(Decimal('1.00'))
+    def cash_balance(self) -> Decimal:
+        return from_micro(self._cash_balance, 2)
     
     @cash_balance.setter
     def cash_balance(self, val):
-        self._cash_balance = Decimal(val)
+        self._cash_balance = to_micro(val)
 
     def __repr__(self) -> str:
         return f"Account(id={self.id!r})"
@@ -40,7 +41,8 @@ class Position(Base):
     currency: Mapped[str] = mapped_column(nullable=True)
     exchange: Mapped[str] = mapped_column(nullable=True)
     primary_exchange: Mapped[str] = mapped_column(nullable=True)
-    _position: Mapped[Decimal] = mapped_column(default=0)
+    sector: Mapped[str] = mapped_column(nullable=True, default=None)
+    _position: Mapped[int] = mapped_column(default=0)  # micro-units
     last_trade: Mapped[float] = mapped_column(nullable=True, default=None)
     quant_rating: Mapped[float] = mapped_column(default=0)
     author_rating: Mapped[float] = mapped_column(default=0)
@@ -51,33 +53,33 @@ class Position(Base):
     momentum: Mapped[float] = mapped_column(default=0)
     epsrevision: Mapped[float] = mapped_column(default=0)
     analyst_target: Mapped[float] = mapped_column(default=0)
-    _target_liquidity: Mapped[Decimal] = mapped_column(default=Decimal('0.00000'))
+    _target_liquidity: Mapped[int] = mapped_column(default=0)  # micro-units
     req_id: Mapped[int|None] = mapped_column(nullable=True, default=None)
     created_at: Mapped[int] = mapped_column(default=int(time.time()))
     updated_at: Mapped[int] = mapped_column(default=int(time.time()))
 
     @property
     def liquidity(self) -> Decimal:
-        if self.account and self.position > 0 and self.last_trade and self.account.cash_balance:
-            return ((self._position * Decimal(self.last_trade)) / self.account.cash_balance).quantize(Decimal('1.00000'))
+        if self.account and self._position > 0 and self.last_trade and self.account._cash_balance:
+            return from_micro(liquidity_micro(self._position, self.last_trade, self.account._cash_balance), 5)
         else:
             return Decimal('0.00000')
 
     @property
-    def position(self):
-        return self._position.quantize(Decimal('1.00'))
+    def position(self) -> Decimal:
+        return from_micro(self._position, 2)
 
     @position.setter
     def position(self, val):
-        self._position = val
+        self._position = to_micro(val)
 
     @property
-    def target_liquidity(self):
-        return self._target_liquidity.quantize(Decimal('1.00000'))
+    def target_liquidity(self) -> Decimal:
+        return from_micro(self._target_liquidity, 5)
 
     @target_liquidity.setter
     def target_liquidity(self, val):
-        self._target_liquidity = val
+        self._target_liquidity = to_micro(val)
 
     # @property
     # def contract(self):
@@ -97,3 +99,35 @@ class Position(Base):
             return f"OWNED -> {self.symbol!r} ({self.primary_exchange!r}) LAST({self.last_trade!r}) QUANT({self.quant_rating!r}) LIQ({self.liquidity!r})"
         else:
             return f"WATCH -> {self.symbol!r} ({self.primary_exchange!r}) LAST({self.last_trade!r}) QUANT({self.quant_rating!r})"
+
+FACTOR_FIELDS = ("quant_rating", "author_rating", "analyst_rating", "valuation", "growth", "profitability", "momentum", "epsrevision", "analyst_target")
+
+class FactorSnapshot(Base):
+    """Factor values for a symbol from ts on, packed as api.factors.FACTORS. Only changes are stored."""
+    __tablename__ = "factor_snapshot"
+    __table_args__ = (Index("ix_factor_snapshot_ts", "ts"),)
+
+    symbol: Mapped[str] = mapped_column(primary_key=True)
+    ts: Mapped[int] = mapped_column(primary_key=True)
+    factors: Mapped[bytes] = mapped_column()
+
+    def __repr__(self) -> str:
+        return f"FactorSnapshot(symbol={self.symbol!r}, ts={self.ts!r})"
+
+class AccountValue(Base):
+    """
+    updateAccountValue history: one row per change of (account, key, currency).
+    Numeric values are integer micro-units (api.fixed); anything else goes in text.
+    """
+    __tablename__ = "account_value"
+    __table_args__ = {"sqlite_with_rowid": False}
+
+    account_id: Mapped[str] = mapped_column(primary_key=True)
+    key: Mapped[str] = mapped_column(primary_key=True)
+    currency: Mapped[str] = mapped_column(primary_key=True)
+    ts: Mapped[int] = mapped_column(primary_key=True)
+    value: Mapped[int|None] = mapped_column(nullable=True, default=None)
+    text: Mapped[str|None] = mapped_column(nullable=True, default=None)
+
+    def __repr__(self) -> str:
+        return f"AccountValue(account_id={self.account_id!r}, key={self.key!r}, currency={self.currency!r}, ts={self.ts!r})"
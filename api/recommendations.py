@@ -1,18 +1,42 @@
+from decimal import Decimal
 from typing import List
+from api.account_values import AccountValues
 from api.models import Position
 
 
-def sell_bad_quants(positions: List[Position]):
+def sell_bad_quants(positions: List[Position], threshold: float = 4):
     sell: List[Position] = []
     for position in positions:
-        if position.quant_rating < 4:
+        if position.quant_rating < threshold:
             sell.append(position)
     return sell
 
-def sell_above_analyst_target(positions: List[Position]):
+def sell_above_analyst_target(positions: List[Position], ratio: float = .95):
     sell: List[Position] = []
     for position in positions:
-        if position.last_trade > position.analyst_target * .95 and position.analyst_target > 0:
+        if position.last_trade > position.analyst_target * ratio and position.analyst_target > 0:
             sell.append(position)
     return sell
 
+def analyst_target_trigger(position: Position, ratio: float = .95):
+    """Price above which sell_above_analyst_target fires for position, or None."""
+    if position.analyst_target > 0:
+        return position.analyst_target * ratio
+    return None
+
+def rebalance_candidates(positions: List[Position], min_score: float = 13):
+    """Positions eligible for a target allocation, best quant rating first."""
+    candidates: List[Position] = []
+    for position in positions:
+        if position.quant_rating + position.analyst_rating + position.author_rating > min_score and position.primary_exchange not in (None, "PINK"):
+            candidates.append(position)
+    return sorted(candidates, key=lambda position: -position.quant_rating)
+
+
+def sizing_base(values: AccountValues, account: str, currency: str = "USD"):
+    """What position weights are measured against: net liquidation, else cash. None if unknown."""
+    for key in ("NetLiquidation", "TotalCashValue", "CashBalance"):
+        val = values.get(account, key, currency)
+        if isinstance(val, Decimal) and val > 0:
+            return val
+    return None
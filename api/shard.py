@@ -0,0 +1,174 @@
+import multiprocessing
+import signal
+import threading
+import time
+import zlib
+from typing import Dict, List
+from sqlalchemy import bindparam, update
+from sqlalchemy.orm import Session
+from api.conf import Config, set_logger
+from api.db import twsDatabase
+from api.models import Position
+from api.wrappers import twsClient, twsWrapper
+from ibapi.common import TickAttrib, TickerId
+from ibapi.contract import Contract
+from ibapi.ticktype import TickType
+from ibapi.utils import iswrapper
+import logging
+
+logger = logging.getLogger('tws-alpha')
+
+def shard_of(symbol: str, shards: int) -> int:
+    """Stable across processes and runs, unlike hash()."""
+    return zlib.crc32(symbol.encode()) % shards
+
+def partition(symbols: List[str], shards: int) -> List[List[str]]:
+    out: List[List[str]] = [[] for _ in range(shards)]
+    for symbol in symbols:
+        out[shard_of(symbol, shards)].append(symbol)
+    return out
+
+
+class twsQuoteWorker(twsDatabase):
+    """
+    Market-data-only client for one shard of the universe. It never touches
+    accounts, orders or Position.req_id (its reqIds live in its own client id
+    space); ticks are coalesced per symbol and flushed to the shared database
+    in one transaction every flush_interval seconds.
+    """
+    def __init__(self, symbols: List[str], flush_interval: float = 1.0, **kwargs) -> None:
+        self.nextValidOrderId = None
+        self.started = False
+        twsWrapper.__init__(self)
+        twsClient.__init__(self, wrapper=self)
+        twsDatabase.__init__(self, **kwargs)
+
+        self.symbols = symbols
+        self.flush_interval = flush_interval
+        self._ticks: Dict[str, float] = {}
+        self._ticks_lock = threading.Lock()
+        self._flusher = threading.Thread(target=self._flush_loop, name="quote-flush", daemon=True)
+
+    def start(self):
+        self.started = True
+        self.reqMarketDataType(4)
+        with Session(self.engine) as session:
+            contracts = []
+            for obj in session.query(Position).filter(Position.symbol.in_(self.symbols)):
+                contract = Contract()
+                contract.symbol = obj.symbol
+                contract.secType = obj.sec_type
+                contract.currency = obj.currency
+                contract.exchange = "SMART"
+                contract.primaryExchange = obj.primary_exchange
+                contracts.append(contract)
+
+        self._flusher.start()
+        logger.info(f"Client {self.clientId} streaming {len(contracts)} symbols")
+        for contract in contracts:
+            reqId = self.nextOrderId()
+            self.req_symbols[reqId] = contract.symbol
+            twsClient.reqMktData(self, reqId, contract, "", False, False, [])
+
+    def stop(self):
+        self.flush()
+        super().stop()
+
+    def flush(self):
+        with self._ticks_lock:
+            ticks, self._ticks = self._ticks, {}
+        if not ticks:
+            return
+        now = int(time.time())
+        # Core executemany rather than the ORM bulk update by primary key: a symbol
+        # whose row was deleted mid-stream matches nothing instead of raising StaleDataError
+        table = Position.__table__
+        stmt = (update(table).where(table.c.symbol == bindparam("b_symbol"))
+                .values(last_trade=bindparam("b_price"), updated_at=now))
+        with Session(self.engine) as session:
+            session.execute(stmt, [dict(b_symbol=symbol, b_price=price) for symbol, price in ticks.items()])
+            session.commit()
+
+    def _flush_loop(self):
+        while self.isConnected():
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Client {self.clientId} flush failed: {e}")
+
+    @iswrapper
+    def nextValidId(self, orderId: int):
+        super().nextValidId(orderId)
+        if not self.started:
+            self.start()
+
+    def error(self, reqId: TickerId, errorCode: int, errorString: str, advancedOrderRejectJson=""):
+        twsWrapper.error(self, reqId, errorCode, errorString, advancedOrderRejectJson)
+        if reqId in self.req_symbols and errorCode not in range(2100, 2200):
+            self.cancelMktData(reqId)
+            self.req_symbols.pop(reqId, None)
+
+    @iswrapper
+    def tickPrice(self, reqId: TickerId, tickType: TickType, price: float, attrib: TickAttrib):
+        symbol = self.req_symbols.get(reqId)
+        if symbol and price and price != -1:
+            with self._ticks_lock:
+                self._ticks[symbol] = price
+        twsWrapper.tickPrice(self, reqId, tickType, price, attrib)
+
+    def keyboardInterrupt(self):
+        self.stop()
+        self.done = True
+
+
+def run_worker(host: str, port: int, clientId: int, symbols: List[str], db_url: str):
+    set_logger(console_level=logging.ERROR, name=f"tws.client{clientId}")
+    app = twsQuoteWorker(symbols, db_url=db_url, wal=True)
+    signal.signal(signal.SIGTERM, lambda signum, frame: app.stop())
+    app.connect(host, port, clientId=clientId)
+    try:
+        app.run()
+    finally:
+        app.stop()
+
+
+class twsShardCoordinator:
+    """
+    Launches one quote worker process per shard, client ids base_client_id..,
+    leaving clientId 0 (the interactive twsStrategy) with accounts and orders.
+    At most Config.MARKET_DATA_LINES symbols are streamed in total.
+    """
+    def __init__(self, host: str, port: int, workers: int, base_client_id: int = 1, db_url: str = Config.DB_URL):
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.base_client_id = base_client_id
+        self.db_url = db_url
+        self.processes: List[multiprocessing.Process] = []
+
+    def start(self, symbols: List[str]):
+        if len(symbols) > Config.MARKET_DATA_LINES:
+            logger.warning(f"{len(symbols)} symbols exceeds {Config.MARKET_DATA_LINES} market data lines; streaming the first {Config.MARKET_DATA_LINES}")
+            symbols = symbols[:Config.MARKET_DATA_LINES]
+
+        ctx = multiprocessing.get_context("spawn")
+        for i, shard in enumerate(partition(symbols, self.workers)):
+            if not shard:
+                continue
+            proc = ctx.Process(
+                target=run_worker,
+                args=(self.host, self.port, self.base_client_id + i, shard, self.db_url),
+                name=f"tws-quotes-{self.base_client_id + i}",
+                daemon=True,
+            )
+            proc.start()
+            self.processes.append(proc)
+            logger.info(f"Started quote worker {proc.name} with {len(shard)} symbols")
+
+    def stop(self, timeout: float = 5.0):
+        for proc in self.processes:
+            proc.terminate()
+        for proc in self.processes:
+            proc.join(timeout)
+        self.processes = []
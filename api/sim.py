@@ -0,0 +1,236 @@
+import json
+import random
+import time
+from decimal import Decimal
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Tuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from api.models import Account, Position
+from api.strategy import twsStrategy
+from ibapi.client import EClient
+from ibapi.contract import Contract, ContractDescription
+from ibapi.server_versions import MAX_CLIENT_VER
+from ibapi.ticktype import TickTypeEnum
+import logging
+
+logger = logging.getLogger('tws-alpha')
+
+# (offset in seconds, callback name, args)
+Event = Tuple[float, str, tuple]
+
+DEFAULT_MIX = {
+    "tickPrice": .80,
+    "updatePortfolio": .10,
+    "position": .05,
+    "symbolSamples": .03,
+    "error": .02,
+}
+
+class OfflineClient:
+    """
+    Stand-in for the TWS socket. Mix in ahead of an EClient subclass: outbound
+    requests are encoded as usual and then counted instead of sent.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.messages_sent = 0
+        self.serverVersion_ = MAX_CLIENT_VER
+        self.connState = EClient.CONNECTED
+        if self.nextValidOrderId is None:
+            self.nextValidOrderId = 1
+
+    def isConnected(self):
+        return True
+
+    def sendMsg(self, msg):
+        self.messages_sent += 1
+
+    def disconnect(self):
+        self.connState = EClient.DISCONNECTED
+
+
+class twsOfflineStrategy(OfflineClient, twsStrategy):
+    pass
+
+
+class WriteCounter:
+    """Counts statements and commits issued against an engine."""
+    def __init__(self, engine):
+        self.statements = 0
+        self.writes = 0
+        self.commits = 0
+        event.listen(engine, "before_cursor_execute", self._execute)
+        event.listen(engine, "commit", self._commit)
+
+    def _execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements += 1
+        if statement.lstrip()[:6].upper() in ("INSERT", "UPDATE", "DELETE"):
+            self.writes += 1
+
+    def _commit(self, conn):
+        self.commits += 1
+
+    def reset(self):
+        self.statements = self.writes = self.commits = 0
+
+
+def make_contract(symbol: str, primary_exchange: str = "NASDAQ") -> Contract:
+    contract = Contract()
+    contract.symbol = symbol
+    contract.secType = "STK"
+    contract.currency = "USD"
+    contract.exchange = "SMART"
+    contract.primaryExchange = primary_exchange
+    return contract
+
+def seed(app: twsStrategy, symbols: List[str], account: str = "DU0000000"):
+    """Pre-populate the universe so callbacks never fall through to reqMatchingSymbols."""
+    with Session(app.engine) as session:
+        if session.get(Account, account) is None:
+            session.add(Account(id=account, cash_balance=100000))
+        for reqId, symbol in enumerate(symbols, start=1):
+            obj = session.get(Position, symbol) or Position(symbol=symbol, currency="USD")
+            obj.sec_type = "STK"
+            obj.primary_exchange = "NASDAQ"
+            obj.req_id = reqId
+            app.req_symbols[reqId] = symbol
+            session.add(obj)
+        session.commit()
+
+def synthetic_events(symbols: List[str], count: int, mix: Dict[str, float] = DEFAULT_MIX, account: str = "DU0000000", seed: int = 0, rate: float = 1000.0) -> Iterator[Event]:
+    rng = random.Random(seed)
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    prices = {symbol: rng.uniform(5, 500) for symbol in symbols}
+
+    for i in range(count):
+        t = i / rate
+        idx = rng.randrange(len(symbols))
+        symbol = symbols[idx]
+        prices[symbol] *= 1 + rng.gauss(0, .001)
+        price = round(prices[symbol], 2)
+        qty = Decimal(rng.randint(0, 500))
+
+        match rng.choices(names, weights)[0]:
+            case "tickPrice":
+                yield (t, "tickPrice", (idx + 1, TickTypeEnum.LAST, price, None))
+            case "updatePortfolio":
+                yield (t, "updatePortfolio", (make_contract(symbol), qty, price, float(qty) * price, price, 0.0, 0.0, account))
+            case "position":
+                yield (t, "position", (account, make_contract(symbol), qty, price))
+            case "symbolSamples":
+                desc = ContractDescription()
+                desc.contract = make_contract(symbol)
+                yield (t, "symbolSamples", (rng.randint(1, 1 << 30), [desc]))
+            case "error":
+                yield (t, "error", (idx + 1, 10089, "Requested market data requires additional subscription"))
+
+def dump_events(events: Iterable[Event], path):
+    with open(path, "w") as f:
+        for t, fn, args in events:
+            f.write(json.dumps({"t": t, "fn": fn, "args": [_encode(a) for a in args]}) + "\n")
+
+def load_events(path) -> Iterator[Event]:
+    with open(path) as f:
+        for line in f:
+            rec = json.loads(line)
+            yield (rec["t"], rec["fn"], tuple(_decode(a) for a in rec["args"]))
+
+def _encode(arg):
+    if isinstance(arg, Decimal):
+        return {"__decimal__": str(arg)}
+    if isinstance(arg, Contract):
+        return {"__contract__": {k: getattr(arg, k) for k in ("symbol", "secType", "currency", "exchange", "primaryExchange")}}
+    if isinstance(arg, list) and arg and isinstance(arg[0], ContractDescription):
+        return {"__descriptions__": [_encode(d.contract) for d in arg]}
+    return arg
+
+def _decode(arg):
+    if isinstance(arg, dict) and "__decimal__" in arg:
+        return Decimal(arg["__decimal__"])
+    if isinstance(arg, dict) and "__contract__" in arg:
+        contract = Contract()
+        for k, v in arg["__contract__"].items():
+            setattr(contract, k, v)
+        return contract
+    if isinstance(arg, dict) and "__descriptions__" in arg:
+        descs = []
+        for c in arg["__descriptions__"]:
+            desc = ContractDescription()
+            desc.contract = _decode(c)
+            descs.append(desc)
+        return descs
+    return arg
+
+
+class twsReplay:
+    """
+    Drives wrapper callbacks from an event stream, in the calling thread, the
+    way EClient.run would from the message queue.
+
+    rate:   callbacks per second; None replays as fast as possible
+    speed:  when rate is None and speed is set, honour recorded offsets scaled by speed
+    """
+    def __init__(self, app: twsStrategy, rate: float = None, speed: float = None):
+        self.app = app
+        self.rate = rate
+        self.speed = speed
+        self.counter = WriteCounter(app.engine)
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.elapsed = 0.0
+
+    def run(self, events: Iterable[Event]):
+        self.counter.reset()
+        start = time.perf_counter()
+        first = None
+
+        for i, (t, fn, args) in enumerate(events):
+            if self.rate:
+                due = start + i / self.rate
+            elif self.speed:
+                first = t if first is None else first
+                due = start + (t - first) / self.speed
+            else:
+                due = None
+            if due is not None:
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+            t0 = time.perf_counter()
+            getattr(self.app, fn)(*args)
+            self.latencies[fn].append(time.perf_counter() - t0)
+
+        self.elapsed = time.perf_counter() - start
+        return self.report()
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        rows = {}
+        total = 0
+        for fn, samples in sorted(self.latencies.items()):
+            total += len(samples)
+            rows[fn] = _summarize(samples)
+        everything = [s for samples in self.latencies.values() for s in samples]
+        rows["*"] = _summarize(everything)
+        rows["*"]["callbacks_per_sec"] = total / self.elapsed if self.elapsed else 0.0
+        rows["*"]["statements_per_callback"] = self.counter.statements / total if total else 0.0
+        rows["*"]["writes_per_callback"] = self.counter.writes / total if total else 0.0
+        rows["*"]["commits_per_callback"] = self.counter.commits / total if total else 0.0
+        return rows
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+def _summarize(samples: List[float]) -> Dict[str, float]:
+    return dict(
+        count=len(samples),
+        p50_us=percentile(samples, 50) * 1e6,
+        p99_us=percentile(samples, 99) * 1e6,
+        max_us=max(samples, default=0.0) * 1e6,
+    )
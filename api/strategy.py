@@ -1,13 +1,26 @@
 from decimal import Decimal
-from typing import List, Tuple
+import threading
+import time
+from typing import Dict, List, Set, Tuple
+import numpy as np
+from api import fixed, metrics
+from api.allocation import allocate, build_candidates
+from api.analytics import PortfolioAnalytics
+from api.conf import Config
 from api.db import twsDatabase
+from api.history import twsHistory
 from api.models import Position
+from api.recommendations import rebalance_candidates, sizing_base
+from api.triggers import TriggerBook
 from api.wrappers import twsClient, twsWrapper
 from etl.load_seekingalpha import capture_keyboard_paste
 from etl.yahoo_finance import get_info
+from ibapi.common import TickAttrib, TickerId
 from ibapi.contract import Contract
 from ibapi.order import Order
+from ibapi.ticktype import TickType, TickTypeEnum
 from ibapi.utils import iswrapper
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session
 from prettytable.colortable import ColorTable, Themes
 import logging
@@ -16,7 +29,10 @@ from utils import COLORS
 
 logger = logging.getLogger('tws-alpha')
 
-class twsStrategy(twsDatabase):
+# bid/ask/close ticks would move prices and fire triggers off quotes nobody traded at
+LAST_TICKS = (TickTypeEnum.LAST, TickTypeEnum.DELAYED_LAST)
+
+class twsStrategy(twsHistory, twsDatabase):
     def __init__(self, *args, **kwargs) -> None:
         self.global_cancel = False
         self.started = False
@@ -26,6 +42,17 @@ class twsStrategy(twsDatabase):
         twsWrapper.__init__(self)
         twsClient.__init__(self, wrapper=self)
         twsDatabase.__init__(self, **kwargs)
+        twsHistory.__init__(self)
+        self.analytics = PortfolioAnalytics(self.bars)
+        self._new_closes: Dict[int, Dict[str, float]] = {}
+        self.triggers = TriggerBook()
+        self._reindex: Set[str] = set()
+        self._polled_at = 0
+        self._polled_prices: Dict[str, float] = {}
+
+        if Config.METRICS:
+            metrics.instrument(self)
+            metrics.instrument_engine(self.engine)
 
     def cancel_all(self):
         logger.warn("Executing Global Cancel")
@@ -45,10 +72,124 @@ class twsStrategy(twsDatabase):
 
         self.cancel_all()
         self.reqMarketDataType(4)
+        self.refresh_analytics()
+        self.index_triggers()
 
         if len(self.accounts) > 1:
             self.reqPositions()
 
+    def refresh_analytics(self):
+        with Session(self.engine) as session:
+            quantities = {obj.symbol: obj.position for obj in session.query(Position)}
+        self.analytics.load(quantities)
+
+    def index_triggers(self, symbols: List[str] = None):
+        with Session(self.engine) as session:
+            query = session.query(Position)
+            if symbols is not None:
+                query = query.filter(Position.symbol.in_(symbols))
+            for obj in query:
+                self.triggers.index(obj)
+
+    def poll_prices(self) -> int:
+        """
+        Feed prices other processes (the quote workers) wrote for owned positions
+        since the last poll to the trigger book and analytics. Returns how many changed.
+        """
+        with Session(self.engine) as session:
+            rows = session.execute(select(Position.symbol, Position.last_trade, Position.updated_at).where(
+                Position._position > 0, Position.last_trade != None, Position.updated_at >= self._polled_at)).all()
+        changed = 0
+        for symbol, price, updated_at in rows:
+            # updated_at has second resolution, so the last second is read again next time
+            self._polled_at = max(self._polled_at, updated_at)
+            if self._polled_prices.get(symbol) == price:
+                continue
+            self._polled_prices[symbol] = price
+            self.analytics.on_tick(symbol, price)
+            self.triggers.on_price(symbol, price)
+            changed += 1
+        return changed
+
+    def start_price_poller(self, interval: float = 1.0):
+        """With quote workers streaming, ticks never reach this process; poll what they flush instead."""
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.poll_prices()
+                except Exception as e:
+                    logger.error(f"Price poll failed: {e}")
+        threading.Thread(target=loop, name="price-poll", daemon=True).start()
+
+    def factors_changed(self, symbols: List[str]):
+        super().factors_changed(symbols)
+        if symbols:
+            self.index_triggers(symbols)
+
+    def bars_stored(self, symbol: str, bar_size: str, bars: np.ndarray):
+        super().bars_stored(symbol, bar_size, bars)
+        if bar_size == self.analytics.bar_size:
+            for ts, close in zip(bars["ts"].tolist(), bars["close"].tolist()):
+                self._new_closes.setdefault(ts, {})[symbol] = close
+
+    @iswrapper
+    def historicalDataEnd(self, reqId: int, start: str, end: str):
+        super().historicalDataEnd(reqId, start, end)
+        if self._pending_bars:
+            return
+        new, self._new_closes = self._new_closes, {}
+        if not new:
+            return
+        symbols = {symbol for closes in new.values() for symbol in closes}
+        if self.analytics.can_roll(symbols, min(new)):
+            # bars that closed since the last load: roll the window instead of rebuilding it
+            for ts in sorted(new):
+                self.analytics.on_bar(new[ts], ts)
+        else:
+            self.refresh_analytics()
+
+    @iswrapper
+    def tickPrice(self, reqId: TickerId, tickType: TickType, price: float, attrib: TickAttrib):
+        super().tickPrice(reqId, tickType, price, attrib)
+        symbol = self.req_symbols.get(reqId)
+        if symbol and price and price != -1 and tickType in LAST_TICKS:
+            self.analytics.on_tick(symbol, price)
+            self.triggers.on_price(symbol, price)
+
+    @iswrapper
+    def updatePortfolio(self, contract: Contract, position: Decimal, marketPrice: float, marketValue: float, averageCost: float, unrealizedPNL: float, realizedPNL: float, accountName: str):
+        super().updatePortfolio(contract, position, marketPrice, marketValue, averageCost, unrealizedPNL, realizedPNL, accountName)
+        self.analytics.set_quantity(contract.symbol, position)
+        self.analytics.on_tick(contract.symbol, marketPrice)
+        self._reindex.add(contract.symbol)
+
+    @iswrapper
+    def position(self, account: str, contract: Contract, position: Decimal, avgCost: float):
+        super().position(account, contract, position, avgCost)
+        self._reindex.add(contract.symbol)
+
+    def flush_reindex(self):
+        """Re-index the positions updated in the last burst with one query, instead of one per callback."""
+        symbols, self._reindex = self._reindex, set()
+        if symbols:
+            self.index_triggers(sorted(symbols))
+
+    @iswrapper
+    def updateAccountTime(self, timeStamp: str):
+        super().updateAccountTime(timeStamp)
+        self.flush_reindex()
+
+    @iswrapper
+    def accountDownloadEnd(self, accountName: str):
+        super().accountDownloadEnd(accountName)
+        self.flush_reindex()
+
+    @iswrapper
+    def positionEnd(self):
+        super().positionEnd()
+        self.flush_reindex()
+
     @iswrapper
     def nextValidId(self, orderId: int):
         super().nextValidId(orderId)
@@ -66,34 +207,42 @@ class twsStrategy(twsDatabase):
         if self.nextValidOrderId is not None and not self.started:
             self.start()
 
-    @iswrapper
-    def updateAccountValue(self, key: str, val: str, currency: str, accountName: str):
-        if currency == "USD":
-            super().updateAccountValue(key, val, currency, accountName)
-
     def keyboardInterrupt(self):
         try:
             self.show_menu()
         except KeyboardInterrupt:
             super().keyboardInterrupt()
 
+    def sizing_base(self, position: Position) -> int:
+        """Micro-units of account value behind position's weight: net liquidation if TWS sent it, else cash."""
+        if not position.account_id:
+            return 0
+        base = sizing_base(self.account_values, position.account_id)
+        if base is not None:
+            return fixed.to_micro(base)
+        return position.account._cash_balance or 0 if position.account else 0
+
     def rebalance_all(self):
         with Session(self.engine) as session:
-            positions = session.query(Position)
-            for position in positions:
-                position.target_liquidity = 0
-            session.add_all(positions)
+            session.execute(update(Position).values(_target_liquidity=0))
             session.commit()
 
+        opts = dict(Config.ALLOCATION)
+        min_score = opts.pop("min_score")
+
         with Session(self.engine) as session:
-            positions = (session.query(Position)
-                .filter(Position.quant_rating + Position.analyst_rating + Position.author_rating > 13)
-                .filter(Position.primary_exchange != "PINK")
-                .order_by(-1 * Position.quant_rating)
-                .limit(5)
-            )
-            for position in positions:
-                position.target_liquidity = .2
+            positions = rebalance_candidates(session.query(Position).all(), min_score)
+            if positions:
+                risk = self.analytics.snapshot()
+                current = fixed.liquidity(
+                    [position._position for position in positions],
+                    [position.last_trade or 0.0 for position in positions],
+                    [self.sizing_base(position) for position in positions],
+                )
+                weights = allocate(build_candidates(positions, current, risk.symbols, risk.covariance), **opts)
+                for position, weight in zip(positions, weights):
+                    position.target_liquidity = Decimal(f"{weight:.5f}")
+                logger.info(f"Allocated {np.count_nonzero(weights)} of {len(positions)} candidates ({opts['strategy']})")
             session.add_all(positions)
             session.commit()
         super().rebalance_all()
@@ -103,9 +252,12 @@ class twsStrategy(twsDatabase):
         print("A\tSelect Account")
         print("B\tBuy Recommendations")
         print("C\tClear Watchlist")
+        print("H\tBackfill History")
         print("L\tLoad New Watchlist (SA)")
+        print("M\tMetrics")
         print("R\tRefresh All")
         print("S\tSell Recommendations")
+        print("T\tTriggered Sells")
         print("Z\tRebalance Export")
         print("X\tExit")
 
@@ -128,6 +280,10 @@ class twsStrategy(twsDatabase):
                     logger.info("Got interrupt. Resuming.")
             case "C":
                 self.clear_watchlist()
+            case "M":
+                print(metrics.registry.table())
+            case "H":
+                self.backfill_all()
             case "R":
                 self.refresh_all()
             case "L":
@@ -143,6 +299,18 @@ class twsStrategy(twsDatabase):
                         self.show_trade_confirmation(order, contract)
                 except KeyboardInterrupt:
                     logger.info("Got interrupt. Resuming.")
+            case "T":
+                try:
+                    for trigger in self.triggers.drain():
+                        with Session(self.engine) as session:
+                            obj = session.get(Position, trigger.symbol)
+                            if not obj or obj._position <= 0:
+                                continue
+                            lmtPrice = obj.analyst_target if trigger.rule == "analyst_target" else obj.last_trade
+                            order, contract = self.sell_order(obj, lmtPrice)
+                        self.show_trade_confirmation(order, contract)
+                except KeyboardInterrupt:
+                    logger.info("Got interrupt. Resuming.")
             case "Z":
                 self.rebalance_all()
             case "X":
@@ -212,6 +380,11 @@ class twsStrategy(twsDatabase):
             COLORS.red(f"""RECOMMEND: {order.action} {order.totalQuantity:.4f} {contract.symbol} @ {order.lmtPrice} {order.tif}""")
         )
         print(c)
+
+        risk = self.analytics.snapshot()
+        if contract.symbol in risk.symbols:
+            row = risk.row(contract.symbol)
+            print(COLORS.dim(f" VOL {row['volatility']:.1%}  BETA {row['beta']:.2f}  MAX DD {row['max_drawdown']:.1%}  WEIGHT {row['weight']:.1%} "))
         
         ratings = []
 
@@ -282,6 +455,8 @@ class twsStrategy(twsDatabase):
         else:
             logger.warn("Not trading this security.")
             return
-        
+
+        if order.orderType == "LMT":
+            order.lmtPrice = fixed.order_price(order.lmtPrice)
         self.placeOrder(self.nextOrderId(), contract, order)
 
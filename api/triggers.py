@@ -0,0 +1,104 @@
+import bisect
+import queue
+import threading
+import time
+from typing import Dict, List, NamedTuple, Set, Tuple
+from api.models import Position
+from api.recommendations import analyst_target_trigger, sell_bad_quants
+import logging
+
+logger = logging.getLogger('tws-alpha')
+
+class Trigger(NamedTuple):
+    symbol: str
+    rule: str
+    price: float
+    threshold: float
+    ts: int
+
+
+class TriggerBook:
+    """
+    Standing sell rules for owned positions.
+
+    Price rules are kept per symbol as a sorted list of (threshold, rule), so a
+    tick checks only its own symbol with one bisect. Rules that don't depend on
+    price (quant rating) are evaluated when the position is (re)indexed. Each
+    rule fires once, then stays quiet until its threshold is updated.
+    """
+    def __init__(self, quant_threshold: float = 4, target_ratio: float = .95):
+        self.quant_threshold = quant_threshold
+        self.target_ratio = target_ratio
+        self.fired: "queue.Queue[Trigger]" = queue.Queue()
+        self._thresholds: Dict[str, List[float]] = {}
+        self._rules: Dict[str, List[str]] = {}
+        self._done: Set[Tuple[str, str]] = set()
+        self._lock = threading.Lock()
+
+    def index(self, position: Position):
+        """Re-derive thresholds for one position; call when it, its ratings or its target change."""
+        symbol = position.symbol
+        if not position._position or position._position <= 0:
+            self.remove(symbol)
+            return
+
+        rules: List[Tuple[float, str]] = []
+        target = analyst_target_trigger(position, self.target_ratio)
+        if target is not None:
+            rules.append((target, "analyst_target"))
+        rules.sort()
+
+        with self._lock:
+            old = dict(zip(self._rules.get(symbol, []), self._thresholds.get(symbol, [])))
+            self._thresholds[symbol] = [t for t, _ in rules]
+            self._rules[symbol] = [r for _, r in rules]
+            for threshold, rule in rules:
+                if old.get(rule) != threshold:
+                    self._done.discard((symbol, rule))
+
+        if sell_bad_quants([position], self.quant_threshold):
+            self._fire(Trigger(symbol, "bad_quant", position.last_trade or 0.0, self.quant_threshold, int(time.time())))
+        else:
+            with self._lock:
+                self._done.discard((symbol, "bad_quant"))
+
+        if position.last_trade:
+            self.on_price(symbol, position.last_trade)
+
+    def remove(self, symbol: str):
+        with self._lock:
+            self._thresholds.pop(symbol, None)
+            self._rules.pop(symbol, None)
+            self._done = {key for key in self._done if key[0] != symbol}
+
+    def on_price(self, symbol: str, price: float) -> List[Trigger]:
+        thresholds = self._thresholds.get(symbol)
+        if not thresholds or thresholds[0] >= price:
+            return []
+        with self._lock:
+            thresholds = self._thresholds.get(symbol, [])
+            rules = self._rules.get(symbol, [])
+            crossed = [(thresholds[i], rules[i]) for i in range(bisect.bisect_left(thresholds, price))]
+        now = int(time.time())
+        return [trigger for trigger in (self._fire(Trigger(symbol, rule, price, threshold, now)) for threshold, rule in crossed) if trigger]
+
+    def drain(self) -> List[Trigger]:
+        out = []
+        while True:
+            try:
+                out.append(self.fired.get_nowait())
+            except queue.Empty:
+                return out
+
+    def _fire(self, trigger: Trigger) -> Trigger | None:
+        key = (trigger.symbol, trigger.rule)
+        with self._lock:
+            if key in self._done:
+                return None
+            self._done.add(key)
+        self.fired.put(trigger)
+        logger.warning(f"SELL TRIGGER: {trigger.symbol} {trigger.rule} @ {trigger.price} (threshold {trigger.threshold})")
+        return trigger
+
+    def __len__(self):
+        return len(self._thresholds)
@@ -1,6 +1,8 @@
 import json
+import threading
 
-from ratelimit import sleep_and_retry, limits
+from ratelimit import limits
+from api.metrics import sleep_and_retry
 from ibapi.client import EClient
 from ibapi.common import TagValueList, TickerId
 from ibapi.contract import Contract
@@ -60,7 +62,14 @@ class twsClient(EClient):
     def reqMktData(self, reqId: TickerId, contract: Contract, genericTickList: str, snapshot: bool, regulatorySnapshot: bool, mktDataOptions: TagValueList):
         return super().reqMktData(reqId, contract, genericTickList, snapshot, regulatorySnapshot, mktDataOptions)
 
+    @sleep_and_retry
+    @limits(calls=60, period=600)
+    def reqHistoricalData(self, reqId: TickerId, contract: Contract, endDateTime: str, durationStr: str, barSizeSetting: str, whatToShow: str, useRTH: int, formatDate: int, keepUpToDate: bool, chartOptions: TagValueList):
+        return super().reqHistoricalData(reqId, contract, endDateTime, durationStr, barSizeSetting, whatToShow, useRTH, formatDate, keepUpToDate, chartOptions)
+
 class twsWrapper(EWrapper):
+    _order_id_lock = threading.Lock()
+
     def __init__(self):
         super().__init__()
 
@@ -94,12 +103,13 @@ class twsWrapper(EWrapper):
         self.nextValidOrderId = orderId
 
     def nextOrderId(self):
-        if self.nextValidOrderId:
-            oid = self.nextValidOrderId
-            self.nextValidOrderId += 1
-            return oid
-        else:
-            raise Exception("Invalid Order ID")
+        with self._order_id_lock:
+            if self.nextValidOrderId:
+                oid = self.nextValidOrderId
+                self.nextValidOrderId += 1
+                return oid
+            else:
+                raise Exception("Invalid Order ID")
 
     @iswrapper
     def updateAccountValue(self, key: str, val: str, currency: str, accountName: str):
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+"""
+Allocation engine timings over candidate-set sizes.
+
+    python -m bench.allocation --sizes 100 1000 3000
+"""
+import argparse
+import time
+import numpy as np
+from prettytable import PrettyTable
+from api.allocation import STRATEGIES, Candidates, allocate
+
+
+def synthetic_candidates(n: int, factors: int = 5, sectors: int = 11, seed: int = 0) -> Candidates:
+    """Scores, current weights, sectors and a factor-model covariance for n symbols."""
+    rng = np.random.default_rng(seed)
+    loadings = rng.normal(0, .15, (n, factors))
+    specific = rng.uniform(.1, .4, n) ** 2
+    current = np.zeros(n)
+    held = rng.choice(n, size=min(n, 20), replace=False)
+    current[held] = 1 / len(held)
+    return Candidates(
+        symbols=[f"S{i:05d}" for i in range(n)],
+        scores=rng.uniform(1, 5, n),
+        current=current,
+        sectors=[f"SECTOR{k}" for k in rng.integers(0, sectors, n)],
+        covariance=loadings @ loadings.T + np.diag(specific),
+    )
+
+def main():
+    cmd = argparse.ArgumentParser("tws-alpha allocation benchmark")
+    cmd.add_argument("--sizes", type=int, nargs="+", default=[100, 500, 1000, 2500])
+    cmd.add_argument("--repeat", type=int, default=3)
+    cmd.add_argument("--turnover-penalty", type=float, default=.001)
+    args = cmd.parse_args()
+
+    table = PrettyTable(["strategy", "candidates", "best ms", "positions", "max weight", "turnover"], float_format=".3")
+    for n in args.sizes:
+        c = synthetic_candidates(n)
+        for strategy in STRATEGIES:
+            best = float("inf")
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                w = allocate(c, strategy=strategy, position_cap=.05, sector_cap=.3, turnover_penalty=args.turnover_penalty, max_positions=None)
+                best = min(best, time.perf_counter() - t0)
+            table.add_row([strategy, n, best * 1e3, np.count_nonzero(w > 1e-6), w.max(), np.abs(w - c.current).sum() / 2])
+    print(table)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+AttrDict.from_nested_dicts vs LazyAttrDict on Yahoo all_modules payloads,
+reading what show_trade_confirmation reads.
+
+    python -m bench.attrdict --record _logs/all_modules.json --symbols AAPL MSFT KO
+    python -m bench.attrdict --payload _logs/all_modules.json
+    python -m bench.attrdict                      # synthetic payload
+"""
+import argparse
+import copy
+import json
+import random
+import time
+from utils import AttrDict, LazyAttrDict
+
+
+def synthetic_payload(symbols: int = 20, modules: int = 30, fields: int = 40, seed: int = 0) -> dict:
+    """Roughly all_modules-shaped: per symbol, modules of raw/fmt pairs, strings and lists."""
+    rng = random.Random(seed)
+    payload = {}
+    for s in range(symbols):
+        data = {
+            "price": {"shortName": f"Company {s}", "regularMarketPrice": f"{rng.uniform(1, 500):.2f}", "currency": "USD"},
+            "summaryProfile": {"sector": "Technology", "industry": "Software", "fullTimeEmployees": str(rng.randint(10, 100000))},
+            "quoteType": {"quoteType": "EQUITY", "exchange": "NMS"},
+        }
+        for m in range(modules):
+            data[f"module{m}"] = {
+                f"field{f}": rng.choice([
+                    f"{rng.uniform(-1e6, 1e6):.4f}",
+                    str(rng.randint(0, 1 << 40)),
+                    rng.choice(["true", "false"]),
+                    "some descriptive text",
+                    {"raw": rng.random(), "fmt": f"{rng.random():.2f}"},
+                    [{"date": str(rng.randint(0, 1 << 31)), "value": f"{rng.random():.3f}"} for _ in range(3)],
+                ])
+                for f in range(fields)
+            }
+        payload[f"sym{s}"] = data
+    return payload
+
+def record(path: str, symbols):
+    from yahooquery import Ticker
+    symbols = [s.lower() for s in symbols]
+    with open(path, "w") as f:
+        json.dump(Ticker(symbols).all_modules, f)
+
+def read_confirmation_fields(info):
+    price = getattr(info, "price")
+    profile = getattr(info, "summaryProfile")
+    quote_type = getattr(info, "quoteType")
+    return (getattr(price, "shortName", "-"), getattr(profile, "sector", ""), getattr(profile, "industry", ""), getattr(quote_type, "quoteType"))
+
+def bench(name: str, fn, payloads, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        # from_nested_dicts mutates its input, so every run gets fresh copies made outside the timer
+        inputs = [copy.deepcopy(p) for p in payloads]
+        t0 = time.perf_counter()
+        for data in inputs:
+            read_confirmation_fields(fn(data))
+        best = min(best, time.perf_counter() - t0)
+    print(f"{name:<28} {best / len(payloads) * 1e6:10.1f} us/symbol")
+    return best
+
+def main():
+    cmd = argparse.ArgumentParser("tws-alpha AttrDict benchmark")
+    cmd.add_argument("--payload", type=str, default=None, help="recorded all_modules JSON")
+    cmd.add_argument("--record", type=str, default=None, help="record all_modules for --symbols to this path and exit")
+    cmd.add_argument("--symbols", type=str, nargs="+", default=["AAPL", "MSFT", "KO", "XOM", "JPM"])
+    cmd.add_argument("--repeat", type=int, default=5)
+    args = cmd.parse_args()
+
+    if args.record:
+        record(args.record, args.symbols)
+        return
+
+    if args.payload:
+        with open(args.payload) as f:
+            payload = json.load(f)
+    else:
+        payload = synthetic_payload()
+    payloads = [v for v in payload.values() if isinstance(v, dict)]
+
+    eager = bench("AttrDict.from_nested_dicts", AttrDict.from_nested_dicts, payloads, args.repeat)
+    lazy = bench("LazyAttrDict", LazyAttrDict.wrap, payloads, args.repeat)
+    print(f"speedup: {eager / lazy:.0f}x over {len(payloads)} symbols")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""
+Callback-path load test against an offline twsStrategy.
+
+    python -m bench.callbacks --symbols 500 --events 20000
+    python -m bench.callbacks --record _logs/events.jsonl --events 5000
+    python -m bench.callbacks --replay _logs/events.jsonl --speed 1
+    python -m bench.callbacks --logging off sync async --format json
+    python -m bench.callbacks --storage disk memory
+"""
+import argparse
+import logging
+import os
+import tempfile
+from prettytable import PrettyTable
+from api import metrics
+from api.conf import Config, reset_logger, set_logger
+from api.sim import dump_events, load_events, seed, synthetic_events, twsOfflineStrategy, twsReplay
+
+
+def build_app(db_path: str, symbols, **kwargs):
+    app = twsOfflineStrategy(fresh=True, db_url=f"sqlite:///{db_path}", **kwargs)
+    seed(app, symbols)
+    return app
+
+def print_report(title: str, report):
+    table = PrettyTable(["callback", "count", "p50 us", "p99 us", "max us"], title=title, float_format=".1")
+    for fn, row in report.items():
+        table.add_row([fn, row["count"], row["p50_us"], row["p99_us"], row["max_us"]])
+    print(table)
+    total = report["*"]
+    print(f"callbacks/sec: {total['callbacks_per_sec']:.0f}  "
+          f"statements/callback: {total['statements_per_callback']:.2f}  "
+          f"writes/callback: {total['writes_per_callback']:.2f}  "
+          f"commits/callback: {total['commits_per_callback']:.2f}")
+
+def main():
+    cmd = argparse.ArgumentParser("tws-alpha callback benchmark")
+    cmd.add_argument("--symbols", type=int, default=200)
+    cmd.add_argument("--events", type=int, default=10000)
+    cmd.add_argument("--rate", type=float, default=None, help="callbacks/sec, default unpaced")
+    cmd.add_argument("--speed", type=float, default=None, help="replay recorded offsets at this speed")
+    cmd.add_argument("--replay", type=str, default=None, help="JSONL event recording to replay")
+    cmd.add_argument("--record", type=str, default=None, help="write the synthetic stream to this file and exit")
+    cmd.add_argument("--seed", type=int, default=0)
+    cmd.add_argument("--no-metrics", action="store_true", default=False, help="disable callback instrumentation")
+    cmd.add_argument("--log-level", type=str, default="CRITICAL")
+    cmd.add_argument("--logging", type=str, nargs="+", default=["off"], choices=["off", "sync", "async"],
+                     help="run once per mode with DEBUG file logging: off, synchronous handlers, or the queue listener")
+    cmd.add_argument("--format", type=str, default="text", choices=["text", "json"], help="log file format")
+    cmd.add_argument("--storage", type=str, nargs="+", default=["disk"], choices=["disk", "memory"],
+                     help="run once per mode: on-disk sqlite, or in memory with checkpoints to disk")
+    cmd.add_argument("--no-rate-limit", action="store_true", default=False, help="log every record")
+    args = cmd.parse_args()
+
+    logging.getLogger('tws-alpha').setLevel(args.log_level)
+    Config.METRICS = not args.no_metrics
+
+    symbols = [f"S{i:04d}" for i in range(args.symbols)]
+    if args.record:
+        dump_events(synthetic_events(symbols, args.events, seed=args.seed), args.record)
+        return
+
+    events = list(load_events(args.replay) if args.replay else synthetic_events(symbols, args.events, seed=args.seed))
+
+    for storage, mode in [(storage, mode) for storage in args.storage for mode in args.logging]:
+        with tempfile.TemporaryDirectory() as tmp:
+            if mode == "off":
+                reset_logger()
+                logging.getLogger('tws-alpha').setLevel(args.log_level)
+            else:
+                set_logger(file_level=logging.DEBUG, console_level=logging.CRITICAL, asynchronous=mode == "async",
+                           fmt=args.format, path=os.path.join(tmp, "tws.log"), rate_limits={} if args.no_rate_limit else None)
+            metrics.registry.reset()
+            app = build_app(os.path.join(tmp, "stocks.sqlite3"), symbols, memory=storage == "memory")
+            report = twsReplay(app, rate=args.rate, speed=args.speed).run(events)
+            if app.checkpointer:
+                app.checkpointer.stop()
+            reset_logger()
+            print_report(f"{'in-memory' if storage == 'memory' else 'on-disk'} sqlite, logging {mode}", report)
+            if Config.METRICS:
+                print(metrics.registry.table())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+"""
+Bulk liquidity (position value / cash) over many rows: the old Decimal
+quantize path, the integer micro-unit path behind Position.liquidity, and the
+vectorized api.fixed.liquidity used by rebalance_all.
+
+    python -m bench.liquidity --rows 1000 10000 100000
+"""
+import argparse
+import random
+import time
+from decimal import Decimal
+from api import fixed
+
+
+def decimal_liquidity(positions, prices, cash):
+    """What Position.liquidity did before micro-units."""
+    out = []
+    for q, p, c in zip(positions, prices, cash):
+        q, c = Decimal(q).quantize(Decimal('1.00')), Decimal(c).quantize(Decimal('1.00'))
+        out.append(((q * Decimal(p)) / c).quantize(Decimal('1.00000')) if q > 0 and p and c else Decimal('0.00000'))
+    return out
+
+def micro_liquidity(positions, prices, cash):
+    return [fixed.from_micro(fixed.liquidity_micro(q, p, c), 5) for q, p, c in zip(positions, prices, cash)]
+
+def bench(name: str, fn, args, repeat: int, rows: int):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    print(f"{name:<24} {rows:>8} rows {best * 1e3:10.2f} ms {best / rows * 1e9:10.0f} ns/row")
+    return best
+
+def main():
+    cmd = argparse.ArgumentParser("tws-alpha liquidity benchmark")
+    cmd.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    cmd.add_argument("--repeat", type=int, default=5)
+    cmd.add_argument("--seed", type=int, default=0)
+    args = cmd.parse_args()
+
+    rng = random.Random(args.seed)
+    for rows in args.rows:
+        shares = [Decimal(rng.randint(0, 5000)) for _ in range(rows)]
+        prices = [round(rng.uniform(1, 500), 2) for _ in range(rows)]
+        cash = [Decimal(rng.randint(10_000, 1_000_000)) for _ in range(rows)]
+        positions_micro = [fixed.to_micro(q) for q in shares]
+        cash_micro = [fixed.to_micro(c) for c in cash]
+
+        old = bench("Decimal quantize", decimal_liquidity, (shares, prices, cash), args.repeat, rows)
+        bench("integer micro-units", micro_liquidity, (positions_micro, prices, cash_micro), args.repeat, rows)
+        new = bench("numpy vectorized", fixed.liquidity, (positions_micro, prices, cash_micro), args.repeat, rows)
+        print(f"speedup: {old / new:.0f}x vectorized over Decimal\n")
+
+if __name__ == "__main__":
+    main()
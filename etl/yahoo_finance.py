@@ -1,11 +1,11 @@
 from yahooquery import Ticker
 
-from utils import AttrDict
+from utils import LazyAttrDict
 
-def get_info(symbol: str) -> AttrDict:
+def get_info(symbol: str) -> LazyAttrDict:
     symbol = symbol.lower()
     ret = Ticker(symbol)
-    return AttrDict.from_nested_dicts(ret.all_modules.get(symbol))
+    return LazyAttrDict.wrap(ret.all_modules.get(symbol))
 
 def get_analyst_target_mean(symbol: str) -> float:
     symbol = symbol.lower()
@@ -18,3 +18,13 @@ def get_analyst_target_mean(symbol: str) -> float:
 
     return 0.00
 
+
+def get_sector(symbol: str) -> str | None:
+    symbol = symbol.lower()
+    ret = Ticker(symbol)
+    data = ret.summary_profile.get(symbol)
+
+    if type(data) == type({}):
+        return data.get('sector')
+
+    return None
@@ -2,9 +2,14 @@
 
 import argparse
 import datetime
+import time
 from pprint import pp
 import logging
+from sqlalchemy.orm import Session
 from api.conf import set_logger
+from api.metrics import MetricsDumper
+from api.models import Position
+from api.shard import twsShardCoordinator
 # from etl.ingress_from_seekingalpha import capture_keyboard_paste
 from api.conf import Config
 from api.db import twsDatabase
@@ -19,6 +24,8 @@ def main():
     cmd.add_argument("-p", "--port", action="store", type=int, dest="port", default=7490, help="Client TCP Port")
     cmd.add_argument("-H", "--host", action="store", type=str, dest="host", default="localhost", help="Client host")
     cmd.add_argument("-C", "--global-cancel", action="store_true", dest="global_cancel", default=False, help="cancel all")
+    cmd.add_argument("-w", "--workers", action="store", type=int, dest="workers", default=0, help="market data worker processes (client ids 1..N)")
+    cmd.add_argument("-m", "--memory", action="store_true", dest="memory", default=Config.DB_MEMORY, help="work on an in-memory copy of the database, checkpointed to disk")
     cmd.add_argument("--wipe", action="store_true", dest="wipe_database", default=False, help="wipe the database on load")
 
     args = cmd.parse_args()
@@ -47,17 +54,39 @@ def main():
     PercentChangeCondition.__setattr__ = utils.setattr_log
     VolumeCondition.__setattr__ = utils.setattr_log
 
-    app = twsStrategy()
+    if args.memory and args.workers:
+        logger.warning("Quote workers write to the database file; ignoring --memory")
+        args.memory = False
+
+    app = twsStrategy(wal=args.workers > 0, memory=args.memory)
 
     if args.global_cancel:
         app.global_cancel = True
 
+    dumper = None
+    if Config.METRICS:
+        dumper = MetricsDumper(time.strftime("_logs/metrics.%Y%m%d_%H%M%S.jsonl"), Config.METRICS_INTERVAL)
+        dumper.start()
+
+    coordinator = None
+    if args.workers:
+        with Session(app.engine) as session:
+            symbols = [obj.symbol for obj in session.query(Position).filter(Position.sec_type != None)]
+        coordinator = twsShardCoordinator(args.host, args.port, args.workers)
+        coordinator.start(symbols)
+        app.start_price_poller()
+
     try:
         app.connect(args.host, args.port, clientId=0)
         logger.debug(f"server version: {app.serverVersion()}, connection time: {app.twsConnectionTime()}")
         app.run()
     except:
         raise Exception(f"Could not connect to {args.host}:{args.port} as client 0")
+    finally:
+        if coordinator:
+            coordinator.stop()
+        if dumper:
+            dumper.stop()
 
 if __name__ == "__main__":
     pp(f"TWS Alpha Seeker v{Config.VERSION} Started")
@@ -0,0 +1,42 @@
+from decimal import Decimal
+from sqlalchemy import create_engine
+from api.account_values import AccountValues
+from api.migrations import migrate
+
+
+def make(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'stocks.sqlite3'}")
+    migrate(engine)
+    return engine, AccountValues(engine)
+
+def test_change_only(tmp_path):
+    engine, values = make(tmp_path)
+    assert values.update("DU1", "NetLiquidation", "1000.50", "USD", ts=1)
+    assert not values.update("DU1", "NetLiquidation", "1000.5", "USD", ts=2)
+    assert values.update("DU1", "NetLiquidation", "1001", "USD", ts=3)
+    assert values.update("DU1", "AccountType", "INDIVIDUAL", "", ts=1)
+    assert values.flush() == 3
+    assert values.history("DU1", "NetLiquidation") == [(1, Decimal("1000.5")), (3, Decimal("1001"))]
+    assert values.get("DU1", "AccountType", "") == "INDIVIDUAL"
+    assert AccountValues(engine).get("DU1", "NetLiquidation") == Decimal("1001")
+
+def test_out_of_range_value(tmp_path):
+    engine, values = make(tmp_path)
+    values.update("DU1", "NetLiquidation", "1000", "USD", ts=1)
+    values.update("DU1", "X", "1.7976931348623157E308", "USD", ts=1)
+    assert values.flush() == 2
+    assert values.history("DU1", "NetLiquidation") == [(1, Decimal("1000"))]
+    assert values.get("DU1", "X") == "1.7976931348623157E308"
+    assert AccountValues(engine).get("DU1", "X") == "1.7976931348623157E308"
+
+def test_failed_flush_keeps_batch(tmp_path):
+    engine, values = make(tmp_path)
+    values.update("DU1", "NetLiquidation", "1000", "USD", ts=1)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("ALTER TABLE account_value RENAME TO account_value_moved")
+    assert values.flush() == 0
+    with engine.begin() as conn:
+        conn.exec_driver_sql("ALTER TABLE account_value_moved RENAME TO account_value")
+    values.update("DU1", "NetLiquidation", "1001", "USD", ts=2)
+    assert values.flush() == 2
+    assert values.history("DU1", "NetLiquidation") == [(1, Decimal("1000")), (2, Decimal("1001"))]
@@ -0,0 +1,22 @@
+import numpy as np
+from api.allocation import Candidates, allocate
+
+
+def candidates(scores, sectors):
+    n = len(scores)
+    return Candidates(symbols=[f"S{i}" for i in range(n)], scores=np.array(scores, dtype=float),
+                      current=np.zeros(n), sectors=sectors)
+
+def test_sector_cap_moves_weight_to_next_names():
+    c = candidates([9, 8, 7, 6, 5, 4], ["Tech", "Tech", "Tech", "Energy", "Health", "Health"])
+    w = allocate(c, position_cap=.25, sector_cap=.5, max_positions=4)
+    assert np.count_nonzero(w) == 4
+    assert w[2] == 0
+    assert np.isclose(w.sum(), 1)
+
+def test_no_max_positions_keeps_every_name():
+    c = candidates([9, 8, 7, 6, 5], ["Tech", "Tech", "Tech", "Energy", "Health"])
+    w = allocate(c, position_cap=.3, sector_cap=.5)
+    assert np.all(w > 0)
+    assert w[:3].sum() <= .5 + 1e-9
+    assert np.isclose(w.sum(), 1)
@@ -0,0 +1,28 @@
+import numpy as np
+from api.analytics import PortfolioAnalytics
+from api.history import BarStore, synthetic_bars
+
+
+def test_rolled_matches_reloaded(tmp_path):
+    store = BarStore(tmp_path)
+    quantities = {"AAA": 10, "BBB": 5}
+    # AAA peaks early and crashes, so its worst drawdown falls out of the window
+    bars = {symbol: synthetic_bars(60, volatility=.05, seed=seed) for seed, symbol in enumerate(quantities)}
+    bars["AAA"]["close"][:10] *= 3
+    for symbol, rows in bars.items():
+        store.append(symbol, "1 day", rows[:40])
+
+    rolled = PortfolioAnalytics(store, window=20)
+    rolled.load(quantities)
+    for i in range(40, 60):
+        for symbol, rows in bars.items():
+            store.append(symbol, "1 day", rows[i:i + 1])
+        rolled.on_bar({symbol: float(rows["close"][i]) for symbol, rows in bars.items()}, int(bars["AAA"]["ts"][i]))
+
+    reloaded = PortfolioAnalytics(store, window=20)
+    reloaded.load(quantities)
+    a, b = rolled.snapshot(), reloaded.snapshot()
+    assert np.allclose(a.covariance, b.covariance)
+    assert np.allclose(a.max_drawdown, b.max_drawdown)
+    assert np.isclose(a.portfolio_max_drawdown, b.portfolio_max_drawdown)
+    assert np.isclose(a.portfolio_drawdown, b.portfolio_drawdown)
@@ -0,0 +1,18 @@
+from api.backtest import FactorSource, synthetic_universe
+
+
+def test_factor_source_has_no_look_ahead():
+    timeline = {"AAA": ([100, 200], [dict(quant_rating=3.0), dict(quant_rating=4.5)])}
+    factors = {"AAA": dict(quant_rating=4.5), "BBB": dict(quant_rating=4.0)}
+    source = FactorSource(factors, timeline=timeline)
+    assert source.at(50) == {"BBB": dict(quant_rating=4.0)}
+    assert source.at(150)["AAA"] == dict(quant_rating=3.0)
+    assert source.at(250)["AAA"] == dict(quant_rating=4.5)
+    assert FactorSource(factors, timeline=timeline, backfill=True).at(50)["AAA"] == dict(quant_rating=3.0)
+
+def test_synthetic_factors_vary_over_time(tmp_path):
+    source = synthetic_universe(tmp_path, 2, bars=100)
+    times, values = source.timeline["SYN0000"]
+    assert len(times) == 5
+    assert len({v["quant_rating"] for v in values}) > 1
+    assert source.at(times[0]) != source.at(times[-1])
@@ -0,0 +1,21 @@
+import json
+import logging
+import pytest
+from api.conf import reset_logger, set_logger
+
+
+@pytest.mark.parametrize("asynchronous", [True, False])
+def test_json_log_keeps_exception(tmp_path, monkeypatch, asynchronous):
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / "tws.jsonl"
+    logger = set_logger(console_level=logging.CRITICAL, asynchronous=asynchronous, fmt="json", path=str(path), rate_limits={})
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        logger.exception("Order %s failed", 7)
+    reset_logger()
+
+    (line,) = path.read_text().splitlines()
+    record = json.loads(line)
+    assert record["msg"] == "Order 7 failed"
+    assert "ZeroDivisionError" in record["exc"]
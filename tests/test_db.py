@@ -0,0 +1,54 @@
+import sqlite3
+import threading
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from api.db import Checkpointer, memory_engine
+
+
+def test_checkpoint_waits_for_commit(tmp_path):
+    path = str(tmp_path / "stocks.sqlite3")
+    engine, connection, lock = memory_engine()
+    checkpointer = Checkpointer(connection, path, lock=lock)
+    with Session(engine) as session:
+        session.execute(text("CREATE TABLE t (x INTEGER)"))
+        session.execute(text("INSERT INTO t VALUES (1)"))
+        session.commit()
+
+    session = Session(engine)
+    session.execute(text("INSERT INTO t VALUES (2)"))
+    backup = threading.Thread(target=checkpointer.checkpoint)
+    backup.start()
+    backup.join(.2)
+    assert backup.is_alive()
+
+    session.rollback()
+    session.close()
+    backup.join(5)
+    assert not backup.is_alive()
+    disk = sqlite3.connect(path)
+    assert disk.execute("SELECT x FROM t").fetchall() == [(1,)]
+    disk.close()
+
+def test_rollback_keeps_other_threads_commits():
+    engine, connection, lock = memory_engine()
+    with Session(engine) as session:
+        session.execute(text("CREATE TABLE t (x INTEGER)"))
+        session.commit()
+
+    session = Session(engine)
+    session.execute(text("INSERT INTO t VALUES (1)"))
+
+    def writer():
+        with Session(engine) as other:
+            other.execute(text("INSERT INTO t VALUES (2)"))
+            other.commit()
+    thread = threading.Thread(target=writer)
+    thread.start()
+    thread.join(.2)
+    assert thread.is_alive()
+
+    session.rollback()
+    session.close()
+    thread.join(5)
+    with Session(engine) as session:
+        assert session.execute(text("SELECT x FROM t")).all() == [(2,)]
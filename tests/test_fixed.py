@@ -0,0 +1,57 @@
+from decimal import Decimal
+import numpy as np
+import pytest
+from api import fixed
+
+
+@pytest.mark.parametrize("val, units", [
+    (0, 0),
+    (12, 12_000_000),
+    (Decimal("10.126"), 10_126_000),
+    ("0.000001", 1),
+    (0.1, 100_000),
+    (101.23, 101_230_000),
+    (-3.5, -3_500_000),
+    (Decimal("0.0000005"), 0),          # half-even
+    (Decimal("0.0000015"), 2),
+    (1e12 + 0.5, 1_000_000_000_000_500_000),
+])
+def test_to_micro(val, units):
+    assert fixed.to_micro(val) == units
+
+@pytest.mark.parametrize("val", ["10.126", "0.000001", "123456789.123456", "-42.5", "0"])
+def test_round_trip(val):
+    assert fixed.from_micro(fixed.to_micro(Decimal(val))) == Decimal(val)
+
+def test_from_micro_places():
+    assert str(fixed.from_micro(10_126_000)) == "10.126000"
+    assert str(fixed.from_micro(10_126_000, 2)) == "10.13"
+    assert str(fixed.from_micro(10_125_000, 2)) == "10.12"    # half-even
+    assert str(fixed.from_micro(102_540, 5)) == "0.10254"
+    assert fixed.from_micro(None) == 0
+
+def test_order_price():
+    assert fixed.order_price(123.456789) == 123.46
+    assert fixed.order_price(0.0345) == 0.0345
+    assert fixed.order_price(0.034567) == 0.0346
+    with pytest.raises(ValueError):
+        fixed.order_price(None)
+
+def test_liquidity_micro_rounding():
+    # 12.5 shares at 101.23 against 12345.67 cash = 0.1024954...
+    assert fixed.liquidity_micro(12_500_000, 101.23, 12_345_670_000) == 102_495
+    # exactly half a micro-unit rounds up
+    assert fixed.liquidity_micro(1, 1.0, 2_000_000) == 1
+    assert fixed.liquidity_micro(1, 1.0, 3_000_000) == 0
+    assert fixed.liquidity_micro(3, 1.0, 2_000_000) == 2
+    assert fixed.liquidity_micro(1, 1.0, -2_000_000) == 0     # -0.5 rounds up too
+    assert fixed.liquidity_micro(0, 101.23, 1) == 0
+    assert fixed.liquidity_micro(1_000_000, None, 1) == 0
+
+def test_liquidity_matches_scalar():
+    positions = [12_500_000, 0, 3_000_000, 5_000_000]
+    prices = [101.23, 50.0, float("nan"), 20.0]
+    cash = [12_345_670_000, 1_000_000, 1_000_000, 0]
+    out = fixed.liquidity(positions, prices, cash)
+    assert out[0] == pytest.approx(fixed.liquidity_micro(positions[0], prices[0], cash[0]) / fixed.MICRO, abs=1e-6)
+    assert list(out[1:]) == [0.0, 0.0, 0.0]
@@ -0,0 +1,61 @@
+import sqlite3
+from decimal import Decimal
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from api.migrations import LATEST, migrate
+from api.models import Account, Position
+
+# schema as created by the baseline models (before any migration existed)
+BASELINE = """
+CREATE TABLE account (
+    id VARCHAR NOT NULL, _cash_balance NUMERIC, created_at INTEGER NOT NULL, updated_at INTEGER NOT NULL,
+    PRIMARY KEY (id)
+);
+CREATE TABLE position (
+    symbol VARCHAR NOT NULL, account_id VARCHAR, sec_type VARCHAR, currency VARCHAR, exchange VARCHAR,
+    primary_exchange VARCHAR, _position NUMERIC NOT NULL, last_trade FLOAT, quant_rating FLOAT NOT NULL,
+    author_rating FLOAT NOT NULL, analyst_rating FLOAT NOT NULL, valuation FLOAT NOT NULL, growth FLOAT NOT NULL,
+    profitability FLOAT NOT NULL, momentum FLOAT NOT NULL, epsrevision FLOAT NOT NULL, analyst_target FLOAT NOT NULL,
+    _target_liquidity NUMERIC NOT NULL, req_id INTEGER, created_at INTEGER NOT NULL, updated_at INTEGER NOT NULL,
+    PRIMARY KEY (symbol), FOREIGN KEY(account_id) REFERENCES account (id)
+);
+INSERT INTO account VALUES ('DU1', 12345.67, 0, 0), ('DU2', NULL, 0, 0);
+INSERT INTO position VALUES
+    ('AAA', 'DU1', 'STK', 'USD', NULL, 'NASDAQ', 10.126, 101.23, 4.5, 4, 4, 0, 0, 0, 0, 0, 150, 0.10254, NULL, 0, 0),
+    ('BBB', NULL, 'STK', 'USD', NULL, 'NYSE', 0, NULL, 3, 3, 3, 0, 0, 0, 0, 0, 0, 0, NULL, 0, 0);
+"""
+
+def test_migrate_baseline(tmp_path):
+    path = tmp_path / "stocks.sqlite3"
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE)
+    conn.close()
+
+    engine = create_engine(f"sqlite:///{path}")
+    migrate(engine)
+
+    conn = sqlite3.connect(path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == LATEST
+    assert conn.execute("SELECT _position, typeof(_position), _target_liquidity FROM position WHERE symbol = 'AAA'").fetchone() == (10_126_000, "integer", 102_540)
+    assert conn.execute("SELECT _cash_balance FROM account ORDER BY id").fetchall() == [(12_345_670_000,), (None,)]
+    conn.close()
+
+    with Session(engine) as session:
+        aaa = session.get(Position, "AAA")
+        assert aaa.position == Decimal("10.13")
+        assert aaa.target_liquidity == Decimal("0.10254")
+        assert aaa.sector is None
+        assert aaa.account.cash_balance == Decimal("12345.67")
+        assert aaa.liquidity == Decimal("0.08303")
+        assert session.get(Position, "BBB")._position == 0
+        assert session.get(Account, "DU2")._cash_balance is None
+
+def test_migrate_is_idempotent(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'stocks.sqlite3'}")
+    migrate(engine)
+    with Session(engine) as session:
+        session.add(Position(symbol="AAA", position=Decimal("10.126")))
+        session.commit()
+    migrate(engine)
+    with Session(engine) as session:
+        assert session.get(Position, "AAA")._position == 10_126_000
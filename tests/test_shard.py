@@ -0,0 +1,28 @@
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+from api.models import Position
+from api.shard import partition, shard_of, twsQuoteWorker
+
+
+def test_partition_is_stable():
+    symbols = ["AAPL", "MSFT", "NVDA", "XOM", "JPM"]
+    shards = partition(symbols, 3)
+    assert sorted(sum(shards, [])) == sorted(symbols)
+    for i, shard in enumerate(shards):
+        assert all(shard_of(symbol, 3) == i for symbol in shard)
+
+def test_flush_skips_deleted_rows(tmp_path):
+    worker = twsQuoteWorker(["AAPL", "MSFT"], db_url=f"sqlite:///{tmp_path / 'stocks.sqlite3'}", wal=True)
+    with Session(worker.engine) as session:
+        session.add_all([Position(symbol="AAPL"), Position(symbol="MSFT")])
+        session.commit()
+    worker.req_symbols = {1: "AAPL", 2: "MSFT"}
+    worker.tickPrice(1, 4, 190.5, None)
+    worker.tickPrice(2, 4, 410.25, None)
+    with Session(worker.engine) as session:
+        session.execute(delete(Position).where(Position.symbol == "MSFT"))
+        session.commit()
+
+    worker.flush()
+    with Session(worker.engine) as session:
+        assert session.execute(select(Position.symbol, Position.last_trade)).all() == [("AAPL", 190.5)]
@@ -1,4 +1,22 @@
 import re
+from collections.abc import Mapping
+
+FLOAT_RE = re.compile(r'^[-+]?[0-9]*\.[0-9]+$')
+INT_RE = re.compile(r'^[0-9]+$')
+
+def coerce(v):
+    """ "true"/"false" to bool, numeric strings to float or int; anything else unchanged. """
+    if type(v) is not str:
+        return v
+    if v == "false":
+        return False
+    if v == "true":
+        return True
+    if INT_RE.match(v):
+        return int(v)
+    if FLOAT_RE.match(v):
+        return float(v)
+    return v
 
 
 class AttrDict(dict):
@@ -26,6 +44,52 @@ class AttrDict(dict):
                 data[k] = new_v
             return cls({key: cls.from_nested_dicts(data[key]) for key in data})
 
+class LazyAttrDict(Mapping):
+    """
+    Read-only attribute view over a raw nested dict, e.g. a Yahoo all_modules
+    payload. Nothing is copied or mutated: values are coerced (nested dicts
+    wrapped) on first access and memoized, so unread modules cost nothing.
+    """
+    __slots__ = ("_data", "_cache")
+
+    def __init__(self, data: dict):
+        self._data = data
+        self._cache = {}
+
+    @classmethod
+    def wrap(cls, data):
+        return cls(data) if isinstance(data, dict) else data
+
+    def __getitem__(self, key):
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+        v = self._data[key]
+        v = LazyAttrDict(v) if isinstance(v, dict) else coerce(v)
+        self._cache[key] = v
+        return v
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __repr__(self) -> str:
+        return f"LazyAttrDict({self._data!r})"
+
 class COLORS:
     @staticmethod
     def fg_rgb(s,r,g,b):